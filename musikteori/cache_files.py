@@ -0,0 +1,33 @@
+import contextlib
+import os
+import pathlib
+import tempfile
+from typing import BinaryIO, Callable
+
+
+def write_atomically(path: pathlib.Path, write: Callable[[BinaryIO], None]) -> bool:
+    """Write a cache file through a temporary file in the same folder, so that other processes never see half of it.
+
+    A cache that can not be written only costs the computation next time, so an OSError is not raised but leaves
+    neither the file nor the temporary file behind.
+
+    Args:
+        path (pathlib.Path):                 The cache file, its folder is created if needed.
+        write (Callable[[BinaryIO], None]): Writes the content to the open file it is called with.
+
+    Returns:
+        bool: Whether the file was written.
+    """
+    path = pathlib.Path(path)
+    with contextlib.suppress(OSError):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=path.parent, suffix=".tmp", delete=False) as f:
+            temporary = pathlib.Path(f.name)
+        try:
+            with open(temporary, "wb") as f:
+                write(f)
+            os.replace(temporary, path)
+            return True
+        finally:
+            temporary.unlink(missing_ok=True)
+    return False
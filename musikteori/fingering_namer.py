@@ -1,48 +1,106 @@
 # https://ianring.com/musictheory/scales/finder/
 
 import argparse
+import functools
 import io
 import itertools
+import multiprocessing
 import pathlib
 import textwrap
-from typing import Sequence
-import json
-import importlib.resources
-
-
-def format_columns_auto(text, max_line_count, max_line_length, paragraph_mark):
-    paragraphs = [paragraph.splitlines() for paragraph in text.split(paragraph_mark)]
-    paragraphs = [paragraph for paragraph in paragraphs if paragraph]
-
-    # Determine the maximum length of a line in the text
-    chunk_height = max(len(paragraph) for paragraph in paragraphs) + 1
-    chunk_width = max(len(line) for paragraph in paragraphs for line in paragraph) + 1
-
-    # page properties
+from typing import Iterable, Iterator, List, Optional, Sequence, TextIO, Tuple
+
+import numpy
+import scipy.sparse.csgraph
+
+from musikteori.pitch_class_sets import SIZE, PitchClassSets, pitch_class_sets
+from musikteori.scale_names import scale_names
+
+
+def measure_paragraphs(paragraphs: Iterable[Sequence[str]]) -> Optional[Tuple[int, int]]:
+    """The (height, width) of the chunk each paragraph gets on a page: the largest paragraph plus one line and one
+    column of space, None if there are no paragraphs. Goes through the paragraphs once, keeping none of them."""
+    chunk_height, chunk_width = 0, 0
+    for paragraph in paragraphs:
+        chunk_height = max(chunk_height, len(paragraph) + 1)
+        chunk_width = max(chunk_width, max((len(line) for line in paragraph), default=0) + 1)
+    return (chunk_height, chunk_width) if chunk_height else None
+
+
+def write_columns(
+    paragraphs: Iterable[Sequence[str]],
+    file: TextIO,
+    *,
+    max_line_count: int,
+    max_line_length: int,
+    chunk_height: int,
+    chunk_width: int,
+) -> int:
+    """Lay out paragraphs in columns, page by page, top to bottom and then left to right, and write the pages
+    separated by form feeds.
+
+    Only the paragraphs of one page are held at a time, so the paragraphs can come from a generator.
+
+    Args:
+        paragraphs (Iterable[Sequence[str]]): The lines of each paragraph, empty paragraphs are skipped.
+        file (TextIO):                         Where to write the pages.
+        max_line_count (int):                  Lines per page.
+        max_line_length (int):                 Characters per line, each line is padded with spaces to this length.
+        chunk_height (int):                    Lines per paragraph, see `measure_paragraphs`.
+        chunk_width (int):                     Characters per paragraph line, see `measure_paragraphs`.
+
+    Returns:
+        int: The number of pages written.
+    """
     nof_colbands = max_line_length // chunk_width
     nof_rowbands = max_line_count // chunk_height
+    if nof_colbands == 0 or nof_rowbands == 0:
+        raise ValueError(
+            f"A {chunk_height}x{chunk_width} paragraph does not fit a {max_line_count}x{max_line_length} page"
+        )
+    blank = " " * chunk_width
+    paragraphs = (paragraph for paragraph in paragraphs if paragraph)
+    nof_pages = 0
+    while page_paragraphs := list(itertools.islice(paragraphs, nof_colbands * nof_rowbands)):
+        if nof_pages:
+            file.write("\f")
+        rows = []
+        for pagerow_ix in range(max_line_count):
+            rowband, chunkrow = divmod(pagerow_ix, chunk_height)
+            row = ""
+            for colband in range(nof_colbands):
+                paragraph_ix = colband * nof_rowbands + rowband
+                if rowband < nof_rowbands and paragraph_ix < len(page_paragraphs):
+                    paragraph = page_paragraphs[paragraph_ix]
+                    row += paragraph[chunkrow].ljust(chunk_width) if chunkrow < len(paragraph) else blank
+                else:
+                    row += blank
+            rows.append(row.ljust(max_line_length))
+        file.write("\n".join(rows))
+        nof_pages += 1
+    return nof_pages
 
-    merged_rows = ""
-    while paragraphs:
-        page = [[" "] * (max_line_length) for _ in range(max_line_count)]
-        for colband in range(nof_colbands):
-            pagecol_offset = colband * chunk_width
-            for rowband in range(nof_rowbands):
-                if not paragraphs:
-                    break
-                pagerow_offset = rowband * chunk_height
-                paragraph = paragraphs.pop(0)
-                for chunkrow, chunkrow_line in enumerate(paragraph):
-                    pagerow_ix = pagerow_offset + chunkrow
-                    page[pagerow_ix][pagecol_offset : pagecol_offset + chunk_width] = list(chunkrow_line)
-
-        # Join each line of the page and then join the lines to form the final string
-        merged_rows += "\n".join("".join(line) for line in page) + "\f"
 
-    return merged_rows.rstrip("\f")
+def format_columns_auto(text, max_line_count, max_line_length, paragraph_mark):
+    paragraphs = [paragraph.splitlines() for paragraph in text.split(paragraph_mark)]
+    chunk_size = measure_paragraphs(paragraph for paragraph in paragraphs if paragraph)
+    if chunk_size is None:
+        return ""
+    chunk_height, chunk_width = chunk_size
+    with io.StringIO() as f:
+        write_columns(
+            paragraphs,
+            f,
+            max_line_count=max_line_count,
+            max_line_length=max_line_length,
+            chunk_height=chunk_height,
+            chunk_width=chunk_width,
+        )
+        return f.getvalue()
 
 
 def scale_id_to_semitones(scale_id):
+    if 0 <= scale_id < SIZE:
+        return list(pitch_class_sets().semitones[scale_id])
     semitones = []
     position = 0
 
@@ -69,54 +127,223 @@ def get_transition_representation(
         return None
     source_text = get_representation(source_semitones)
     target_text = get_representation(target_semitones)
-    transitions = list(source_text)
-    target_list = list(target_text)
-    if len(transitions) < len(target_list):
-        transitions.extend("-" * (len(target_list) - len(transitions)))
-    for ix, char in enumerate(source_text):
-        if char.isdigit():
-            # find where it should go
-            if (tix := find_destination(target_list, ix)) is not None:
-                target_list[tix] = "X"
-                action = tix - ix
-                if abs(action) > movement_max:
-                    return None
-                if action > 0:
-                    if action <= 2:
-                        for delta in range(action):
-                            transitions[ix + delta] = "\\"
-                    elif action <= 9:
-                        transitions[ix] = "\\"
-                        transitions[ix + 1] = str(abs(action))
-                    else:
-                        raise ValueError(f"{source_text}, {transitions}, {target_list}")
-                elif action == 0:
-                    transitions[ix] = "|"
-                elif action < 0:
-                    if abs(action) <= 2:
-                        for delta in range(0, action, -1):
-                            transitions[ix + delta] = "/"
-                    elif abs(action) <= 9:
-                        transitions[ix - 1] = str(abs(action))
-                        transitions[ix] = "/"
-                    else:
-                        raise ValueError(f"{source_text}, {transitions}, {target_list}")
+    return _transition_lines(
+        source_text, target_text, _digit_positions(source_text), _digit_positions(target_text), movement_max
+    )
+
+
+def _digit_positions(text: str) -> List[int]:
+    return [ix for ix, char in enumerate(text) if char.isdigit()]
+
+
+def _transition_lines(
+    source_text: str,
+    target_text: str,
+    source_positions: Sequence[int],
+    target_positions: Sequence[int],
+    movement_max: int,
+) -> Optional[List[str]]:
+    """The source line, the finger movements and the target line, None if a finger moves too far.
 
+    The j-th digit of the source line goes to the j-th digit of the target line, if there is one.
+    """
+    transitions = list(source_text)
+    if len(transitions) < len(target_text):
+        transitions.extend("-" * (len(target_text) - len(transitions)))
+    for ix, tix in itertools.zip_longest(source_positions, target_positions[: len(source_positions)]):
+        if tix is not None:
+            action = tix - ix
+            if abs(action) > movement_max:
+                return None
+            if action > 0:
+                if action <= 2:
+                    for delta in range(action):
+                        transitions[ix + delta] = "\\"
+                elif action <= 9:
+                    transitions[ix] = "\\"
+                    transitions[ix + 1] = str(abs(action))
+                else:
+                    raise ValueError(f"{source_text}, {transitions}, {target_text}")
+            elif action == 0:
+                transitions[ix] = "|"
+            elif action < 0:
+                if abs(action) <= 2:
+                    for delta in range(0, action, -1):
+                        transitions[ix + delta] = "/"
+                elif abs(action) <= 9:
+                    transitions[ix - 1] = str(abs(action))
+                    transitions[ix] = "/"
                 else:
-                    raise ValueError(f"{source_text}, {transitions}, {target_list}")
+                    raise ValueError(f"{source_text}, {transitions}, {target_text}")
+
             else:
-                transitions[ix] = "-"
+                raise ValueError(f"{source_text}, {transitions}, {target_text}")
+        else:
+            transitions[ix] = "-"
     return [source_text, "".join(transitions).rstrip("-"), target_text]
 
 
-def find_destination(target_list, ix):
-    for tix, tchar in enumerate(target_list):
-        if tchar.isdigit():
-            return tix
-    return None
+UNREACHABLE = 255
+
+
+def transition_costs(
+    source_ids: numpy.ndarray, target_ids: numpy.ndarray, *, movement_max: int, fret_max: int
+) -> numpy.ndarray:
+    """The total finger movement from every source to every target, UNREACHABLE where a finger moves too far.
+
+    The j-th digit of the source line moves to the j-th digit of the target line (source digits beyond the target
+    digits stay put), so the movements are the differences of the digit positions in the two lines, as in
+    `get_transition_representation`.
+
+    Args:
+        source_ids (numpy.ndarray): Scale ids of the source fingerings, (s,).
+        target_ids (numpy.ndarray): Scale ids of the target fingerings, (t,).
+        movement_max (int):         The max number of semitones a finger can move.
+        fret_max (int):             The highest fret a target can use.
+
+    Returns:
+        numpy.ndarray: The costs [semitones], capped below UNREACHABLE, uint8 (s, t).
+    """
+    table = pitch_class_sets()
+    source_ids, target_ids = numpy.asarray(source_ids), numpy.asarray(target_ids)
+    source_positions = table.digit_positions[source_ids].astype(numpy.int8)
+    target_positions = table.digit_positions[target_ids].astype(numpy.int8)
+    source_counts, target_counts = table.digit_counts[source_ids], table.digit_counts[target_ids]
+    costs = numpy.zeros((len(source_ids), len(target_ids)), dtype=numpy.int16)
+    longest = numpy.zeros((len(source_ids), len(target_ids)), dtype=numpy.int8)
+    # a digit at a time, on (source, target) planes of small integers
+    for digit in range(source_positions.shape[1]):
+        movements = numpy.abs(target_positions[:, digit] - source_positions[:, digit, numpy.newaxis])
+        movements *= (source_counts[:, numpy.newaxis] > digit) & (target_counts > digit)
+        costs += movements
+        numpy.maximum(longest, movements, out=longest)
+    feasible = (longest <= movement_max) & (table.highest[target_ids] <= fret_max)
+    return numpy.where(feasible, numpy.minimum(costs, UNREACHABLE - 1), UNREACHABLE).astype(numpy.uint8)
+
+
+def feasible_transitions(
+    source_semitones: Sequence[int], target_ids: numpy.ndarray, *, movement_max: int, fret_max: int
+) -> numpy.ndarray:
+    """Which targets `get_transition_representation` keeps, for a whole batch of target scale ids at once.
+
+    Args:
+        source_semitones (Sequence[int]): The source fingering, integers in [0, 12).
+        target_ids (numpy.ndarray):       Scale ids of the targets, (n,).
+        movement_max (int):               The max number of semitones a finger can move.
+        fret_max (int):                   The highest fret a target can use.
+
+    Returns:
+        numpy.ndarray: True for the targets to keep, (n,).
+    """
+    source_ids = [PitchClassSets.scale_id(source_semitones)]
+    return transition_costs(source_ids, target_ids, movement_max=movement_max, fret_max=fret_max)[0] < UNREACHABLE
+
+
+class TransitionCosts:
+    def __init__(self, ids: numpy.ndarray, costs: numpy.ndarray):
+        """The cost of going from one hand shape to another, for every pair of a set of hand shapes.
+
+        Args:
+            ids (numpy.ndarray):   Scale ids of the hand shapes, (n,).
+            costs (numpy.ndarray): Total finger movement from ids[i] to ids[j] at [i, j], UNREACHABLE if some finger
+                                   moves too far, uint8 (n, n).
+        """
+        self.ids = ids
+        self.costs = costs
+        self._index = {scale_id: ix for ix, scale_id in enumerate(ids.tolist())}
+
+    @classmethod
+    def compute(
+        cls,
+        ids: Sequence[int],
+        *,
+        movement_max: int,
+        fret_max: int,
+        processes: Optional[int] = None,
+        chunk_size: int = 256,
+    ) -> "TransitionCosts":
+        """Compute the costs in chunks of source hand shapes, in a process pool unless processes is 1."""
+        ids = numpy.asarray(ids)
+        chunks = [ids[start : start + chunk_size] for start in range(0, len(ids), chunk_size)]
+        costs_for = functools.partial(transition_costs, target_ids=ids, movement_max=movement_max, fret_max=fret_max)
+        if processes == 1 or len(chunks) <= 1:
+            rows = [costs_for(chunk) for chunk in chunks]
+        else:
+            with multiprocessing.Pool(processes) as pool:
+                rows = pool.map(costs_for, chunks)
+        return cls(ids, numpy.concatenate(rows) if rows else numpy.zeros((0, 0), dtype=numpy.uint8))
+
+    def save(self, path: pathlib.Path):
+        numpy.savez(path, ids=self.ids, costs=self.costs)
+
+    @classmethod
+    def load(cls, path: pathlib.Path) -> "TransitionCosts":
+        with numpy.load(path) as data:
+            return cls(data["ids"], data["costs"])
+
+    def cost(self, source_semitones: Sequence[int], target_semitones: Sequence[int]) -> Optional[int]:
+        """The cost of going straight from one hand shape to the other, None if a finger would move too far."""
+        cost = self.costs[self._ix(source_semitones), self._ix(target_semitones)]
+        return None if cost == UNREACHABLE else int(cost)
+
+    def route(self, source_semitones: Sequence[int], target_semitones: Sequence[int]) -> Optional[Tuple[int, List]]:
+        """The cheapest way from one hand shape to another, through any of the others.
+
+        Returns:
+            Optional[Tuple[int, List]]: The total cost and the hand shapes (semitones) along the way, None if there is
+                                        no way.
+        """
+        source, target = self._ix(source_semitones), self._ix(target_semitones)
+        graph = scipy.sparse.csgraph.csgraph_from_dense(self.costs, null_value=UNREACHABLE)
+        distances, predecessors = scipy.sparse.csgraph.dijkstra(graph, indices=source, return_predecessors=True)
+        if numpy.isinf(distances[target]):
+            return None
+        route = [target]
+        while route[-1] != source:
+            route.append(predecessors[route[-1]])
+        table = pitch_class_sets()
+        return int(distances[target]), [list(table.semitones[self.ids[ix]]) for ix in reversed(route)]
+
+    def _ix(self, semitones: Sequence[int]) -> int:
+        scale_id = PitchClassSets.scale_id(semitones)
+        if scale_id not in self._index:
+            raise KeyError(f"{semitones} is not one of the hand shapes")
+        return self._index[scale_id]
+
+
+def get_transition_representations(
+    source_semitones: Sequence[int], targets: Iterable[Sequence[int]], *, movement_max: int, fret_max: int
+) -> Iterator[Tuple[Sequence[int], List[str]]]:
+    """(target, transition representation) for the targets `get_transition_representation` keeps, in order.
+
+    The targets are filtered in one batch with `feasible_transitions` and only the ones kept are rendered. Fingerings
+    that are not integers in [0, 12) are done one at a time.
+    """
+    targets = list(targets)
+    source_id = PitchClassSets.scale_id(source_semitones)
+    target_ids = [PitchClassSets.scale_id(target) for target in targets]
+    if source_id is None or None in target_ids:
+        for target in targets:
+            if representation := get_transition_representation(
+                source_semitones, target, movement_max=movement_max, fret_max=fret_max
+            ):
+                yield target, representation
+        return
+    table = pitch_class_sets()
+    target_ids = numpy.array(target_ids, dtype=int)
+    source_text = table.representations[source_id]
+    source_positions = table.digit_positions[source_id, : table.digit_counts[source_id]].tolist()
+    kept = feasible_transitions(source_semitones, target_ids, movement_max=movement_max, fret_max=fret_max)
+    for ix in numpy.flatnonzero(kept).tolist():
+        target_id = target_ids[ix]
+        target_positions = table.digit_positions[target_id, : table.digit_counts[target_id]].tolist()
+        target_text = table.representations[target_id]
+        yield targets[ix], _transition_lines(source_text, target_text, source_positions, target_positions, movement_max)
 
 
 def get_representation(semitones: Sequence):
+    if (scale_id := PitchClassSets.scale_id(semitones)) is not None:
+        return pitch_class_sets().representations[scale_id]
     representation = ""
     for position in range(12):
         if position in semitones:
@@ -177,41 +404,78 @@ if __name__ == "__main__":
         type=int,
         help="The number of lines per page. (defaults: Courier New 8pt in landscape mode)",
     )
+    parser.add_argument(
+        "--sources",
+        default=[[0, 2, 4, 6]],
+        nargs="*",
+        type=lambda text: [int(semitone) for semitone in text.split(",")],
+        help="Source fingerings, as comma separated semitones",
+    )
+    parser.add_argument("--all-sources", action="store_true", help="Use every target fingering as a source too")
+    parser.add_argument("--skip-charts", action="store_true", help="Do not write the fingering charts")
+    parser.add_argument(
+        "--costs", default=None, type=pathlib.Path, help="Write the source x target transition costs here (.npz)"
+    )
+    parser.add_argument(
+        "--route",
+        default=None,
+        nargs=2,
+        type=lambda text: [int(semitone) for semitone in text.split(",")],
+        help="Print the cheapest way between two fingerings, as comma separated semitones",
+    )
+    parser.add_argument(
+        "--processes", default=None, type=int, help="Processes computing the costs (default: all cores)"
+    )
     args = parser.parse_args()
 
-    with importlib.resources.open_text(__package__, "scales.json", encoding="utf-8") as f:
-        scales = json.load(f)
-    with importlib.resources.open_text(__package__, "dozenal.json", encoding="utf-8") as f:
-        dozenal = json.load(f)
-    scale_names = dict()
-    for key, value in dozenal.items():
-        value: str
-        if value.isascii():
-            scale_names[key] = value
+    targets = list(generate_scales(args.fingers, True))
+    sources = [list(target) for target in targets] if args.all_sources else args.sources
+
+    names = scale_names()
+    max_name_length = names.max_word_length
+
+    def chart_paragraphs(source):
+        for scale_semitones, (source_text, transitions, target_text) in get_transition_representations(
+            source, targets, movement_max=args.movement_max, fret_max=args.fret_max
+        ):
+            scale_name = names.names[semitones_to_scale_id(scale_semitones)]
+            yield generate_text(
+                source_text, transitions, target_text, scale_name, max_name_length=max_name_length
+            ).splitlines()
+
+    for source in [] if args.skip_charts else sources:
+        # one pass to size the columns, one to write the pages, so no chart is held in memory
+        chunk_size = measure_paragraphs(chart_paragraphs(source))
+        if chunk_size is None:
+            continue
+
+        if len(sources) == 1:
+            formatted_output_path: pathlib.Path = args.output_root / f"fingerings-{args.fingers}.txt"
         else:
-            scale_names[key] = scales[key]
-
-    max_name_length = 0
-    for scale_key, scale_name in scale_names.items():
-        scale_key: str
-        if scale_key.isdigit():
-            for word in scale_name.split():
-                max_name_length = max(max_name_length, len(word))
-
-    unformatted_text = ""
-    # ¶ did not seem to be visualized as I intended
-    paragraph_mark = "\n\n"
-    for scale_semitones in generate_scales(args.fingers, True):
-        if (
-            transition_representaiton := get_transition_representation(
-                [0, 2, 4, 6], scale_semitones, movement_max=args.movement_max, fret_max=args.fret_max
+            source_name = "_".join(str(semitone) for semitone in source)
+            formatted_output_path = args.output_root / f"fingerings-{args.fingers}-from-{source_name}.txt"
+        chunk_height, chunk_width = chunk_size
+        with open(formatted_output_path, "w", encoding="utf-8") as f:
+            write_columns(
+                chart_paragraphs(source),
+                f,
+                max_line_count=args.line_count,
+                max_line_length=args.line_length,
+                chunk_height=chunk_height,
+                chunk_width=chunk_width,
             )
-        ) is not None:
-            source_text, transitions, target_text = transition_representaiton
-            scale_id = semitones_to_scale_id(scale_semitones)
-            scale_name = scale_names[str(scale_id)]
-            unformatted_text += f"{paragraph_mark}{generate_text(source_text, transitions, target_text, scale_name, max_name_length = max_name_length)}"
-
-    formatted_text = format_columns_auto(unformatted_text, args.line_count, args.line_length, paragraph_mark)
-    formatted_output_path: pathlib.Path = args.output_root / f"fingerings-{args.fingers}.txt"
-    formatted_output_path.write_text(formatted_text, encoding="utf-8")
+
+    if args.costs is not None or args.route is not None:
+        shapes = sources + [list(target) for target in targets] + (args.route or [])
+        ids = list(dict.fromkeys(PitchClassSets.scale_id(shape) for shape in shapes))
+        costs = TransitionCosts.compute(
+            ids, movement_max=args.movement_max, fret_max=args.fret_max, processes=args.processes
+        )
+        if args.costs is not None:
+            costs.save(args.costs)
+        if args.route is not None:
+            if (route := costs.route(*args.route)) is None:
+                print("No route")
+            else:
+                cost, steps = route
+                print(f"{cost}: " + " -> ".join(get_representation(step) for step in steps))
@@ -0,0 +1,207 @@
+import argparse
+import pathlib
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy
+
+from musikteori.fingering_namer import measure_paragraphs, write_columns
+from musikteori.jins_diagram import regular_tuning
+from musikteori.pitch_class_sets import STEPS, pitch_class_sets
+from musikteori.scale_names import scale_names
+
+
+class Position(NamedTuple):
+    string: int  # 0 is the highest string, the top row of a `jins_diagram.Printer`
+    fret: int
+    finger: int  # 0 on an open string
+
+
+class Fingering(NamedTuple):
+    cost: int
+    positions: Tuple[Position, ...]
+
+
+class Fretboard:
+    def __init__(
+        self, string_pitches: Sequence[float], *, fret_max: int = 12, fingers: int = 4, open_strings: bool = True
+    ):
+        """Fingerings of scales over all strings of a fretted instrument.
+
+        A note is played in a state (string, fret, finger, hand), where the hand is the fret under the first finger
+        and each finger has a fret of its own. Going from one note to the next costs:
+            * a fret for each fret the hand shifts,
+            * a string for each string skipped, two for each string back towards the lower strings,
+            * one for fretting two strings after each other with the same finger.
+
+        Args:
+            string_pitches (Sequence[float]): Pitch of each open string in semitones, highest first,
+                                              e.g. `jins_diagram.regular_tuning(5)`.
+            fret_max (int):                   The highest fret to use.
+            fingers (int):                    Number of fretting fingers.
+            open_strings (bool):              Whether to play open strings, the hand can be anywhere then.
+        """
+        if any(pitch != int(pitch) for pitch in string_pitches):
+            raise ValueError(f"The strings must be tuned a whole number of semitones apart: {string_pitches}")
+        self.string_pitches = [int(pitch) for pitch in string_pitches]
+        self.fret_max = fret_max
+        self.fingers = fingers
+        self.open_strings = open_strings
+        self._states: Dict[int, numpy.ndarray] = dict()
+
+    @classmethod
+    def regular(cls, regular_tuning_semitones: int = 5, nof_strings: int = 4, **kwargs) -> "Fretboard":
+        """The strings of a `jins_diagram.Printer` with the same tuning, see `Fretboard` for the kwargs."""
+        return cls(regular_tuning(regular_tuning_semitones, nof_strings), **kwargs)
+
+    def states(self, pitch: int) -> numpy.ndarray:
+        """Every way to play a pitch, rows of (string, fret, finger, hand), computed once per pitch."""
+        if pitch not in self._states:
+            rows = []
+            for string, open_pitch in enumerate(self.string_pitches):
+                fret = pitch - open_pitch
+                if fret == 0 and self.open_strings:
+                    rows.extend((string, 0, 0, hand) for hand in range(1, self.fret_max + 1))
+                elif 1 <= fret <= self.fret_max:
+                    rows.extend(
+                        (string, fret, finger, fret - finger + 1)
+                        for finger in range(1, self.fingers + 1)
+                        if fret - finger + 1 >= 1
+                    )
+            states = numpy.array(rows, dtype=numpy.int64).reshape(-1, 4)
+            states.flags.writeable = False
+            self._states[pitch] = states
+        return self._states[pitch]
+
+    @staticmethod
+    def transition_costs(source: numpy.ndarray, dest: numpy.ndarray) -> numpy.ndarray:
+        """The cost from each source state to each dest state, (len(source), len(dest))."""
+        source_string, _, source_finger, source_hand = (column[:, numpy.newaxis] for column in source.T)
+        dest_string, _, dest_finger, dest_hand = dest.T
+        crossed = source_string - dest_string
+        costs = numpy.abs(dest_hand - source_hand)
+        costs += numpy.maximum(crossed - 1, 0) + 2 * numpy.maximum(-crossed, 0)
+        costs += (source_finger == dest_finger) & (dest_finger > 0) & (crossed != 0)
+        return costs
+
+    def _solve(self, pitches: Sequence[int]) -> Iterator[Fingering]:
+        """The cheapest fingering of the pitches from each state of the first pitch.
+
+        Dynamic programming backwards over the pitches: the cheapest way to finish from each state of a pitch is
+        computed once and shared by all the states before it.
+        """
+        states = [self.states(pitch) for pitch in pitches]
+        if any(len(pitch_states) == 0 for pitch_states in states):
+            return
+        to_go = numpy.zeros(len(states[-1]), dtype=numpy.int64)
+        choices = []
+        for source, dest in reversed(list(zip(states, states[1:]))):
+            total = self.transition_costs(source, dest) + to_go
+            choice = total.argmin(axis=1)
+            to_go = total[numpy.arange(len(source)), choice]
+            choices.append(choice)
+        choices.reverse()
+        for start, cost in enumerate(to_go.tolist()):
+            path = [start]
+            for choice in choices:
+                path.append(int(choice[path[-1]]))
+            yield Fingering(
+                cost, tuple(Position(*pitch_states[ix, :3].tolist()) for pitch_states, ix in zip(states, path))
+            )
+
+    def fingerings(
+        self, semitones: Sequence[int], *, root: int = 0, octaves: int = 1, top: Optional[int] = None
+    ) -> List[Fingering]:
+        """The cheapest fingering of a scale from each string and fret where it can start, cheapest first.
+
+        The scale is played upwards from its lowest pitch class over the octaves and back to that pitch class, starting
+        from every octave of it that fits on the fretboard.
+
+        Args:
+            semitones (Sequence[int]): The pitch classes of the scale, relative to the root.
+            root (int):                Pitch of the root, relative to the second string (as in `regular_tuning`).
+            octaves (int):             Number of octaves to play.
+            top (Optional[int]):       Keep only this many fingerings.
+
+        Returns:
+            List[Fingering]: One fingering per start position.
+        """
+        steps = sorted({semitone % STEPS for semitone in semitones})
+        steps = [octave * STEPS + step for octave in range(octaves) for step in steps] + [octaves * STEPS + steps[0]]
+        lowest, highest = min(self.string_pitches), max(self.string_pitches) + self.fret_max
+        best: Dict[Tuple[int, int], Fingering] = dict()
+        for start in range(root + STEPS * ((lowest - root - steps[0]) // STEPS), highest - steps[-1] + 1, STEPS):
+            for fingering in self._solve([start + step for step in steps]):
+                first = fingering.positions[0][:2]
+                if first not in best or fingering < best[first]:
+                    best[first] = fingering
+        return sorted(best.values())[:top]
+
+    def diagram(self, fingering: Fingering) -> List[str]:
+        """A row per string, highest first, and a column per fret, with the finger on each fret that is played."""
+        rows = [["-"] * (self.fret_max + 1) for _ in self.string_pitches]
+        for string, fret, finger in fingering.positions:
+            rows[string][fret] = str(finger)
+        return [f"{row[0]}|{''.join(row[1:])}" for row in rows]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Chart the cheapest fingerings of every scale with a number of notes over all strings",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--notes", default=7, type=int, help="The number of notes in the scales")
+    parser.add_argument("--octaves", default=1, type=int, help="The number of octaves to play")
+    parser.add_argument("--top", default=3, type=int, help="The number of fingerings per scale")
+    parser.add_argument("--regular-tuning-semitones", default=5, type=int, help="Semitones between the strings")
+    parser.add_argument("--strings", default=4, type=int, help="The number of strings")
+    parser.add_argument("--fret-max", default=12, type=int, help="The highest fret to use")
+    parser.add_argument("--fingers", default=4, type=int, help="The number of fretting fingers")
+    parser.add_argument("--no-open-strings", action="store_true", help="Fret every note")
+    parser.add_argument(
+        "--line-length",
+        default=152,
+        type=int,
+        help="The number of characters per line. (defaults: Courier New 8pt in landscape mode)",
+    )
+    parser.add_argument(
+        "--line-count",
+        default=52,
+        type=int,
+        help="The number of lines per page. (defaults: Courier New 8pt in landscape mode)",
+    )
+    parser.add_argument(
+        "--output-root", default=pathlib.Path().cwd(), type=pathlib.Path, help="Parent folder to the output file"
+    )
+    args = parser.parse_args()
+
+    fretboard = Fretboard.regular(
+        args.regular_tuning_semitones,
+        args.strings,
+        fret_max=args.fret_max,
+        fingers=args.fingers,
+        open_strings=not args.no_open_strings,
+    )
+    table = pitch_class_sets()
+    names = scale_names().names
+    scale_ids = [scale_id for scale_id in range(len(table.counts)) if table.counts[scale_id] == args.notes]
+    scale_ids = [scale_id for scale_id in scale_ids if scale_id & 1]  # scales with a root
+
+    def chart_paragraphs():
+        for scale_id in scale_ids:
+            scale_name = names.get(scale_id, table.representations[scale_id])
+            for fingering in fretboard.fingerings(table.semitones[scale_id], octaves=args.octaves, top=args.top):
+                yield [f"{scale_name} ({fingering.cost})", *fretboard.diagram(fingering)]
+
+    chunk_size = measure_paragraphs(chart_paragraphs())
+    if chunk_size is None:
+        parser.exit(1, "No scale fits on the fretboard\n")
+    chunk_height, chunk_width = chunk_size
+    with open(args.output_root / f"fretboard-fingerings-{args.notes}.txt", "w", encoding="utf-8") as f:
+        write_columns(
+            chart_paragraphs(),
+            f,
+            max_line_count=args.line_count,
+            max_line_length=args.line_length,
+            chunk_height=chunk_height,
+            chunk_width=chunk_width,
+        )
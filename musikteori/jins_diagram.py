@@ -1,16 +1,33 @@
 import argparse
+import multiprocessing
 from openpyxl import Workbook
 from openpyxl.worksheet.worksheet import Worksheet
+from openpyxl.worksheet._write_only import WriteOnlyWorksheet
 from openpyxl.worksheet.page import PageMargins
 from openpyxl.worksheet.pagebreak import Break
-from openpyxl.cell.cell import Cell
-from openpyxl.styles import PatternFill, Font
+from openpyxl.cell.cell import WriteOnlyCell
+from openpyxl.styles import NamedStyle, PatternFill, Font
 from openpyxl.utils import get_column_letter
 import pathlib
-from typing import Dict, List
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
 
 import numpy
-import maqamator
+
+from musikteori import maqamator
+
+# Classes of the cells of a fretboard grid, a later class wins where a pitch is of several kinds
+UNUSED, EXTENSION, PITCHES, MODULATION, TONIC = range(5)
+OCTAVE = 8  # added to the class of a cell whose pitch is of that kind only an octave away
+CLASS_NAMES = ("unused", "extension", "pitches", "modulation", "tonic")  # the keys in a theme
+
+# Named styles of the Excel cells, plain and an octave away (bold), within the octave and outside it (grayed)
+STYLE_NAMES = ("fretboard", "fretboard octave")
+OUTSIDE_STYLE_NAMES = ("fretboard outside", "fretboard octave outside")
+
+
+def regular_tuning(regular_tuning_semitones: float = 5, nof_strings: int = 4) -> List[float]:
+    """Open string pitches of a regular tuning, highest string first, relative to the second string."""
+    return [(1 - string) * regular_tuning_semitones for string in range(nof_strings)]
 
 
 class Printer:
@@ -46,31 +63,58 @@ class Printer:
     ):
         self.theme = theme
         self.ajnas = ajnas
+        self.regular_tuning_semitones = regular_tuning_semitones
+        self.row_semitones = row_semitones
         # Generate the fretboard grid
         steps = numpy.linspace(0, row_semitones, row_semitones * 4 + 1).tolist()
         self._pitches_for_strings = [
-            [step + regular_tuning_semitones for step in steps],
-            steps,
-            [step - regular_tuning_semitones for step in steps],
-            [step - 2 * regular_tuning_semitones for step in steps],
+            [step + open_pitch for step in steps] for open_pitch in regular_tuning(regular_tuning_semitones)
         ]
         self._atol = (
             float(min([min(numpy.diff(pitches_for_string)) for pitches_for_string in self._pitches_for_strings])) * 0.5
         )
+        self._pitch_grid = numpy.array(self._pitches_for_strings)
+        self._symbols = [""] * (OCTAVE + len(CLASS_NAMES))
+        for symbol_class, name in enumerate(CLASS_NAMES):
+            self._symbols[symbol_class] = theme[name]
+            self._symbols[symbol_class + OCTAVE] = theme[name] + "\u20dd"  # Combining Enclosing Circle
+        self._grids: Dict[maqamator.CompiledJins, numpy.ndarray] = dict()
+
+    def with_theme(self, theme: Dict[str, str]) -> "Printer":
+        """The same fretboard in another theme, sharing the symbol grids with this one."""
+        printer = Printer(self.ajnas, theme, self.regular_tuning_semitones, self.row_semitones)
+        printer._grids = self._grids
+        return printer
+
+    def symbol_grid(self, jins: maqamator.Jins) -> numpy.ndarray:
+        """The class of each cell of the fretboard for a jins, (strings, steps), computed once per jins content.
+
+        A cell is TONIC, MODULATION, PITCHES or EXTENSION, in order of precedence, if its pitch is that close to a pitch
+        of that kind, else the same plus OCTAVE if its pitch reduced to an octave is, else UNUSED.
+        """
+        compiled = jins.compile()
+        if compiled not in self._grids:
+            assert compiled.wholestep == 2.0
+            kinds = [compiled.extension_pitches, compiled.pitches, compiled.modulation_pitches]
+            references = numpy.concatenate(kinds)
+            classes = numpy.repeat([EXTENSION, PITCHES, MODULATION], [len(kind) for kind in kinds])
+            pitches = numpy.stack([self._pitch_grid, self._pitch_grid % 12])
+            near = numpy.abs(pitches[..., numpy.newaxis] - references) <= self._atol
+            grid = numpy.where(near, classes, UNUSED).max(axis=-1, initial=UNUSED)
+            grid[pitches == 0] = TONIC
+            in_octave, shifted = grid
+            grid = numpy.where(in_octave != UNUSED, in_octave, numpy.where(shifted != UNUSED, shifted + OCTAVE, UNUSED))
+            grid = grid.astype(numpy.int8)
+            grid.flags.writeable = False
+            self._grids[compiled] = grid
+        return self._grids[compiled]
 
     def _generate_fretboard_grid(self, *, ajnas: Dict[str, maqamator.Jins]):
         """Generate a fretboard-like grid with pitches represented by symbols."""
-        name_to_grid = dict()
-        for jins_name, jins in ajnas.items():
-            name_to_grid[jins_name] = []
-            for pitches_for_string in self._pitches_for_strings:
-                row = []
-                for pitch in pitches_for_string:
-                    symbol = self._get_symbol(self.theme, jins, pitch)
-                    row.append(symbol)
-                name_to_grid[jins_name].append(row)
+        return {jins_name: self._symbol_rows(jins) for jins_name, jins in ajnas.items()}
 
-        return name_to_grid
+    def _symbol_rows(self, jins: maqamator.Jins) -> List[List[str]]:
+        return [[self._symbols[symbol_class] for symbol_class in row] for row in self.symbol_grid(jins).tolist()]
 
     def __str__(self):
         name_to_grid = self._generate_fretboard_grid(ajnas=self.ajnas)
@@ -91,35 +135,6 @@ class Printer:
             ]
         )
 
-    def _approx_in(self, query: float, items: List[float]):
-        return any(abs(query - reference) <= self._atol for reference in items)
-
-    def _get_symbol(self, pitch_map, jins: maqamator.Jins, pitch):
-        assert jins.wholestep == 2.0
-        symbol = None
-        if self._approx_in(pitch, jins.extension_pitches):
-            symbol = pitch_map["extension"]
-        if self._approx_in(pitch, jins.pitches):
-            symbol = pitch_map["pitches"]
-        if self._approx_in(pitch, jins.modulation_pitches):
-            symbol = pitch_map["modulation"]
-        if pitch == 0:
-            symbol = pitch_map["tonic"]
-        if symbol is None:
-            shifted = pitch % 12
-            octave_symbol = "\u20dd"  # Combining Enclosing Circle
-            if self._approx_in(shifted, jins.extension_pitches):
-                symbol = pitch_map["extension"] + octave_symbol
-            if self._approx_in(shifted, jins.pitches):
-                symbol = pitch_map["pitches"] + octave_symbol
-            if self._approx_in(shifted, jins.modulation_pitches):
-                symbol = pitch_map["modulation"] + octave_symbol
-            if shifted == 0:
-                symbol = pitch_map["tonic"] + octave_symbol
-            if symbol is None:
-                symbol = pitch_map["unused"]
-        return symbol
-
     def _name_to_grid_to_string(self, *, pitches_for_strings, grid):
         text = ""
         for i, row in enumerate(grid):
@@ -144,105 +159,203 @@ class Printer:
 
     def to_excel(self, excel_path: pathlib.Path):
         """Writes each jins to an Excel file with fretboard-symbols per cell.
-        Symbols ending with \u20dd get highlighted.
+        Symbols an octave away get highlighted.
+
+        The sheet is streamed row by row (openpyxl write-only mode) with a few shared named styles, so the time and
+        memory grow linearly with the number of ajnas.
         """
-        wb = Workbook()
+        wb = Workbook(write_only=True)
+        for style in _named_styles():
+            wb.add_named_style(style)
+        ws = wb.create_sheet()
         page_height_in_mm = 297 - 20
         row_height_in_mm = 5
-        if (ws := wb.active) is not None:
-            current_height = 0
-            row_ix = 1
-            ws.cell(row=row_ix, column=1, value=str(self.theme))
-            for jins_name, jins in self.ajnas.items():
-                current_height = row_ix * row_height_in_mm
-                predicted_height = current_height + (2 + len(self._pitches_for_strings)) * row_height_in_mm
-                if (predicted_height % page_height_in_mm) < (current_height % page_height_in_mm):
-                    # would overflow the page, start a new page
-                    ws.row_breaks.append(Break(id=row_ix))
-                    row_ix += 1
-                    ws.cell(row=row_ix, column=1, value=str(self.theme))
-                    row_ix += 2
-                else:
-                    row_ix += 2  # blank line between ajnas
-
-                ws.cell(row=row_ix, column=1, value=jins_name)
-                ws.cell(row=row_ix, column=1).font = Font(name="Consolas Regular", size=10)
-                for string_pitches in self._pitches_for_strings:
-                    row_ix += 1
-                    col_ix = 0
-                    for pitch in string_pitches:
-                        col_ix += 1
-                        symbol = self._get_symbol(self.theme, jins, pitch)
-                        use_bold_font = False
-                        if symbol and symbol.endswith("\u20dd"):
-                            symbol = symbol[:-1]  # Remove the combining circle for Excel
-                            use_bold_font = True
-                        fractional_part = pitch - int(pitch)
-                        if fractional_part == 0:
-                            symbol = self.theme["unused_halftone"] if symbol == "" else symbol
-                        if use_bold_font:
-                            # make the text bold in this cell.
-                            ws.cell(row=row_ix, column=col_ix, value=symbol)
-                            ws.cell(row=row_ix, column=col_ix).font = Font(name="Consolas Regular", bold=True, size=10)
-                        else:
-                            ws.cell(row=row_ix, column=col_ix, value=symbol)
-                            ws.cell(row=row_ix, column=col_ix).font = Font(name="Consolas Regular", size=10)
-                        if pitch < 0 or pitch >= 12.0:
-                            # make grayer for out-of-octave notes
-                            ws.cell(row=row_ix, column=col_ix).fill = PatternFill(
-                                start_color="DDDDDD", end_color="DDDDDD", fill_type="solid"
-                            )
-
-            ws.page_margins.left = 10 / 25.4
-            ws.page_margins.right = 10 / 25.4
-            ws.page_margins.top = 10 / 25.4
-            ws.page_margins.bottom = 10 / 25.4
-            width_in_mm = (210 - 10 * 2) / ws.max_column
-            self.set_width(ws, width_in_mm)
-            self.set_height(ws, row_height_in_mm)
-            ws.print_area = f"A1:{get_column_letter(ws.max_column)}{ws.max_row}"
-            wb.save(excel_path)
-
-    def set_width(self, ws: Worksheet, side_in_mm):
-        for row_ix in range(1, ws.max_row + 1):
-            for cell in ws[row_ix]:
-                if isinstance(cell, Cell):
-                    # 96 DPI, 25.4 mm/inch, approx N pixels per character in Excel
-                    ws.column_dimensions[cell.column_letter].width = side_in_mm * (96 / (25.4 * 7.5))
-
-    def set_height(self, ws: Worksheet, side_in_mm):
-        for row_ix in range(1, ws.max_row + 1):
-            # 72 points per inch, 25.4 mm/inch
-            ws.row_dimensions[row_ix].height = side_in_mm * 72 / 25.4
+        nof_columns = max(len(pitches_for_string) for pitches_for_string in self._pitches_for_strings)
+        ws.page_margins.left = 10 / 25.4
+        ws.page_margins.right = 10 / 25.4
+        ws.page_margins.top = 10 / 25.4
+        ws.page_margins.bottom = 10 / 25.4
+        self.set_width(ws, (210 - 10 * 2) / nof_columns, nof_columns)
+        self.set_height(ws, row_height_in_mm)
+
+        row_count = 0
+        for row_ix, row in self._excel_rows(ws, page_height_in_mm, row_height_in_mm):
+            for _ in range(row_count + 1, row_ix):
+                ws.append([])
+            ws.append(row)
+            row_count = row_ix
+        ws.print_area = f"A1:{get_column_letter(nof_columns)}{row_count}"
+        wb.save(excel_path)
+
+    def _excel_rows(self, ws: WriteOnlyWorksheet, page_height_in_mm: float, row_height_in_mm: float):
+        """The (row number, cells) of the sheet in order, adding the page breaks to the sheet on the way."""
+        # the same for every jins: which cells are on a halftone, and which are outside the octave (grayed)
+        halftone = (self._pitch_grid == numpy.trunc(self._pitch_grid)).tolist()
+        outside = ((self._pitch_grid < 0) | (self._pitch_grid >= 12.0)).tolist()
+        style_names = [[OUTSIDE_STYLE_NAMES if grayed else STYLE_NAMES for grayed in row] for row in outside]
+        symbols = [self.theme[name] for name in CLASS_NAMES]
+
+        def cell(value, style_name):
+            written = WriteOnlyCell(ws, value=value)
+            written.style = style_name
+            return written
+
+        row_ix = 1
+        yield row_ix, [str(self.theme)]
+        for jins_name, jins in self.ajnas.items():
+            current_height = row_ix * row_height_in_mm
+            predicted_height = current_height + (2 + len(self._pitches_for_strings)) * row_height_in_mm
+            if (predicted_height % page_height_in_mm) < (current_height % page_height_in_mm):
+                # would overflow the page, start a new page
+                ws.row_breaks.append(Break(id=row_ix))
+                row_ix += 1
+                yield row_ix, [str(self.theme)]
+                row_ix += 2
+            else:
+                row_ix += 2  # blank line between ajnas
+
+            yield row_ix, [cell(jins_name, STYLE_NAMES[0])]
+            grid = self.symbol_grid(jins)
+            for string_ix, classes in enumerate(grid.tolist()):
+                row_ix += 1
+                row = []
+                for col_ix, symbol_class in enumerate(classes):
+                    symbol = symbols[symbol_class % OCTAVE]
+                    if halftone[string_ix][col_ix] and symbol == "":
+                        symbol = self.theme["unused_halftone"]
+                    # bold instead of the combining circle for an octave away
+                    row.append(cell(symbol, style_names[string_ix][col_ix][symbol_class >= OCTAVE]))
+                yield row_ix, row
+
+    def set_width(self, ws: Union[Worksheet, WriteOnlyWorksheet], side_in_mm, nof_columns):
+        for column_ix in range(1, nof_columns + 1):
+            # 96 DPI, 25.4 mm/inch, approx N pixels per character in Excel
+            ws.column_dimensions[get_column_letter(column_ix)].width = side_in_mm * (96 / (25.4 * 7.5))
+
+    def set_height(self, ws: Union[Worksheet, WriteOnlyWorksheet], side_in_mm):
+        # 72 points per inch, 25.4 mm/inch
+        ws.sheet_format.defaultRowHeight = side_in_mm * 72 / 25.4
+        ws.sheet_format.customHeight = True
+
+
+def _named_styles() -> List[NamedStyle]:
+    """Fresh styles for a workbook, a named style belongs to one workbook."""
+    styles = []
+    for names, fill in [
+        (STYLE_NAMES, PatternFill()),
+        (OUTSIDE_STYLE_NAMES, PatternFill(start_color="DDDDDD", end_color="DDDDDD", fill_type="solid")),
+    ]:
+        for name, bold in zip(names, [False, True]):
+            styles.append(NamedStyle(name=name, font=Font(name="Consolas Regular", bold=bold, size=10), fill=fill))
+    return styles
+
+
+def catalogs() -> Dict[str, Dict[str, maqamator.Jins]]:
+    """The ajnas catalogs to chart, by name."""
+    return {
+        "arabic": {key: maqamator.arabic_ajnas[key] for key in sorted(maqamator.arabic_ajnas)},
+        "turkish": maqamator.turkish_ajnas,
+        "nonstandard": maqamator.nonstandard_ajnas(),
+    }
+
+
+class ChartConfig(NamedTuple):
+    catalog: str
+    theme: str
+    regular_tuning_semitones: float = 5
+    row_semitones: int = 12
+
+    def stem(self) -> str:
+        """The file name without suffix, e.g. ajnas-stars or turkish-ajnas-crossed-tuning7-row24."""
+        stem = "ajnas" if self.catalog == "arabic" else f"{self.catalog}-ajnas"
+        stem = f"{stem}-{self.theme}"
+        if (self.regular_tuning_semitones, self.row_semitones) != (5, 12):  # the default tuning keeps short names
+            stem = f"{stem}-tuning{self.regular_tuning_semitones:g}-row{self.row_semitones}"
+        return stem
+
+
+def _write_chart(printer: Printer, path: pathlib.Path) -> pathlib.Path:
+    if path.suffix == ".xlsx":
+        printer.to_excel(path)
+    else:
+        path.write_text(str(printer), encoding="utf-8")
+    return path
+
+
+def generate_charts(
+    configs: Iterable[ChartConfig],
+    output_root: pathlib.Path,
+    *,
+    suffixes: Iterable[str] = (".txt", ".xlsx"),
+    processes: Optional[int] = None,
+    ajnas_catalogs: Optional[Dict[str, Dict[str, maqamator.Jins]]] = None,
+) -> List[pathlib.Path]:
+    """Write a chart per configuration and suffix, <output_root>/<stem><suffix> (see `ChartConfig.stem`).
+
+    The symbol grids of each catalog, tuning and row length are computed once here and shared by all the themes, then
+    the charts are written in a process pool, the slow Excel files first.
+
+    Args:
+        configs (Iterable[ChartConfig]):   The catalog, theme, tuning and row length of each chart.
+        output_root (pathlib.Path):        Parent folder to the charts.
+        suffixes (Iterable[str]):          .txt and/or .xlsx.
+        processes (Optional[int]):         Number of worker processes, all cores if None, none if 1.
+        ajnas_catalogs (Optional[Dict]):   The catalogs by name, `catalogs()` if None.
+
+    Returns:
+        List[pathlib.Path]: The written charts.
+    """
+    ajnas_catalogs = catalogs() if ajnas_catalogs is None else ajnas_catalogs
+    printers: Dict[Tuple[str, float, int], Printer] = dict()
+    tasks = []
+    for config in configs:
+        key = (config.catalog, config.regular_tuning_semitones, config.row_semitones)
+        theme = Printer.themes[config.theme]
+        if key not in printers:
+            printers[key] = Printer(ajnas_catalogs[config.catalog], theme, *key[1:])
+            for jins in printers[key].ajnas.values():
+                printers[key].symbol_grid(jins)
+        printer = printers[key].with_theme(theme)
+        tasks.extend((printer, output_root / f"{config.stem()}{suffix}") for suffix in suffixes)
+    tasks.sort(key=lambda task: task[1].suffix != ".xlsx")
+    if processes == 1:
+        return [_write_chart(*task) for task in tasks]
+    with multiprocessing.Pool(processes) as pool:
+        return pool.starmap(_write_chart, tasks, chunksize=1)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
-        description="Choose a drawing theme", formatter_class=argparse.ArgumentDefaultsHelpFormatter
+        description="Write the fretboard charts of every combination of catalog, theme, tuning and row length",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--catalogs", nargs="+", choices=catalogs().keys(), default=["arabic", "turkish"], help="The ajnas to chart"
     )
     parser.add_argument(
-        "--theme",
+        "--themes",
+        nargs="+",
         choices=Printer.themes.keys(),
-        default="stars",
-        help="Choose a theme for the printing.",
+        default=["stars"],
+        help="Choose themes for the printing.",
     )
-    args = parser.parse_args()
-    selected_theme = Printer.themes[args.theme]
-
-    pathlib.Path(f"ajnas-{args.theme}.txt").write_text(
-        str(
-            Printer(
-                ajnas={key: maqamator.arabic_ajnas[key] for key in sorted(maqamator.arabic_ajnas)}, theme=selected_theme
-            )
-        ),
-        encoding="utf-8",
+    parser.add_argument(
+        "--tunings", nargs="+", type=float, default=[5], help="Semitones between the strings, e.g. 5 for fourths"
     )
-
-    Printer(
-        ajnas={key: maqamator.arabic_ajnas[key] for key in sorted(maqamator.arabic_ajnas)}, theme=selected_theme
-    ).to_excel(pathlib.Path(f"ajnas-{args.theme}.xlsx"))
-
-    pathlib.Path(f"turkish-ajnas-{args.theme}.txt").write_text(
-        str(Printer(ajnas=maqamator.turkish_ajnas, theme=selected_theme)),
-        encoding="utf-8",
+    parser.add_argument("--row-semitones", nargs="+", type=int, default=[12], help="Semitones per row")
+    parser.add_argument("--suffixes", nargs="+", choices=[".txt", ".xlsx"], default=[".txt", ".xlsx"])
+    parser.add_argument("--processes", default=None, type=int, help="Processes writing the charts (default: all cores)")
+    parser.add_argument(
+        "--output-root", default=pathlib.Path().cwd(), type=pathlib.Path, help="Parent folder to the output files"
     )
+    args = parser.parse_args()
+
+    configs = [
+        ChartConfig(catalog, theme, tuning, row_semitones)
+        for catalog in args.catalogs
+        for theme in args.themes
+        for tuning in args.tunings
+        for row_semitones in args.row_semitones
+    ]
+    for path in generate_charts(configs, args.output_root, suffixes=args.suffixes, processes=args.processes):
+        print(path)
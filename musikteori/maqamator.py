@@ -1,32 +1,268 @@
-from typing import List, Optional
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
 import enum
+import functools
+
+import numpy
 
 
 class Jins:
     def __init__(
         self,
         *,
-        pitches: List[float],
-        extension_pitches: List[float] = [],
-        modulation_pitches: Optional[List[float]] = None,
-        tonics: List[float] = [0],
+        pitches: Sequence[float],
+        extension_pitches: Sequence[float] = (),
+        modulation_pitches: Optional[Sequence[float]] = None,
+        tonics: Sequence[float] = (0,),
         wholestep: float = 2.0,
     ):
         """
 
         Args:
-            pitches (List[float]):                      The pitches of the jins in [steps]. Usually the lowest pitch is the tonic and the highest pitch the ghammaz. Tonic should be 0.
-            extension_pitches (List[float]):            Pitches for noodling around in that are not part of the usual pitches [steps]. Jins baggage. Default: [].
-            modulation_pitches (Optional[List[float]]): Modulation points in terms of pitches [steps]. (unison, ghammaz, (octave), ...). Set to pitches if None.
-            tonics (List[float]):                       The tonics, in order of decreasing rank
-            wholestep (float):                          Value for [steps / wholestep] (where one whole step = P5 + P5 - P8).
+            pitches (Sequence[float]):                      The pitches of the jins in [steps]. Usually the lowest pitch is the tonic and the highest pitch the ghammaz. Tonic should be 0.
+            extension_pitches (Sequence[float]):            Pitches for noodling around in that are not part of the usual pitches [steps]. Jins baggage. Default: [].
+            modulation_pitches (Optional[Sequence[float]]): Modulation points in terms of pitches [steps]. (unison, ghammaz, (octave), ...). Set to pitches if None.
+            tonics (Sequence[float]):                       The tonics, in order of decreasing rank
+            wholestep (float):                              Value for [steps / wholestep] (where one whole step = P5 + P5 - P8).
         """
-        self.pitches = pitches
-        self.extension_pitches = extension_pitches
-        self.modulation_pitches = pitches if modulation_pitches is None else modulation_pitches
-        self.tonics = tonics
+        self.pitches = list(pitches)
+        self.extension_pitches = list(extension_pitches)
+        self.modulation_pitches = list(pitches if modulation_pitches is None else modulation_pitches)
+        self.tonics = list(tonics)
         self.wholestep = wholestep
 
+    def compile(self) -> "CompiledJins":
+        """The immutable array form of the jins as it is right now. Compiled once per distinct content."""
+        return _compile(
+            tuple(self.pitches),
+            tuple(self.extension_pitches),
+            tuple(self.modulation_pitches),
+            tuple(self.tonics),
+            self.wholestep,
+        )
+
+
+class CompiledJins:
+    __slots__ = (
+        "pitches",
+        "extension_pitches",
+        "modulation_pitches",
+        "tonics",
+        "wholestep",
+        "notes",
+        "pitch_class_mask",
+        "quartertone_mask",
+        "_key",
+        "_hash",
+    )
+
+    def __init__(
+        self,
+        *,
+        pitches: Sequence[float],
+        extension_pitches: Sequence[float],
+        modulation_pitches: Sequence[float],
+        tonics: Sequence[float],
+        wholestep: float,
+    ):
+        """Frozen, array backed form of a `Jins` (see `Jins.compile`) for hot loops. Hashable, so it can be a dict key.
+
+        pitches and extension_pitches are sorted, modulation_pitches and tonics keep their order of rank.
+        notes is every pitch of the jins (pitches, extensions, modulation points and tonics) sorted and unique.
+        pitch_class_mask has bit n set if a pitch is within a quarter of a semitone of pitch class n,
+        quartertone_mask likewise for the quarter tones (bit n for n / 2 semitones).
+        """
+        key = (tuple(pitches), tuple(extension_pitches), tuple(modulation_pitches), tuple(tonics), wholestep)
+        setattr_ = super().__setattr__
+        setattr_("pitches", _frozen(sorted(pitches)))
+        setattr_("extension_pitches", _frozen(sorted(extension_pitches)))
+        setattr_("modulation_pitches", _frozen(modulation_pitches))
+        setattr_("tonics", _frozen(tonics))
+        setattr_("wholestep", wholestep)
+        setattr_(
+            "notes", _frozen(numpy.unique(numpy.concatenate([pitches, extension_pitches, modulation_pitches, tonics])))
+        )
+        setattr_("pitch_class_mask", pitch_mask(self.pitches, steps_per_octave=12))
+        setattr_("quartertone_mask", pitch_mask(self.pitches, steps_per_octave=24))
+        setattr_("_key", key)
+        setattr_("_hash", hash(key))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __eq__(self, other):
+        return isinstance(other, CompiledJins) and self._key == other._key
+
+    def __hash__(self):
+        return self._hash
+
+    def __reduce__(self):
+        pitches, extension_pitches, modulation_pitches, tonics, wholestep = self._key
+        return _compile, (pitches, extension_pitches, modulation_pitches, tonics, wholestep)
+
+    def to_jins(self) -> Jins:
+        pitches, extension_pitches, modulation_pitches, tonics, wholestep = self._key
+        return Jins(
+            pitches=pitches,
+            extension_pitches=extension_pitches,
+            modulation_pitches=modulation_pitches,
+            tonics=tonics,
+            wholestep=wholestep,
+        )
+
+
+def _frozen(values) -> numpy.ndarray:
+    array = numpy.array(values, dtype=float)
+    array.flags.writeable = False
+    return array
+
+
+@functools.lru_cache(maxsize=None)
+def _compile(pitches, extension_pitches, modulation_pitches, tonics, wholestep) -> CompiledJins:
+    return CompiledJins(
+        pitches=pitches,
+        extension_pitches=extension_pitches,
+        modulation_pitches=modulation_pitches,
+        tonics=tonics,
+        wholestep=wholestep,
+    )
+
+
+def pitch_mask(pitches: Sequence[float], *, steps_per_octave: int = 12, threshold: float = 0.25) -> int:
+    """Bitmask of the octave-reduced pitches, with bit n set for step n of steps_per_octave equal steps.
+
+    Args:
+        pitches (Sequence[float]): The pitches [semitones].
+        steps_per_octave (int):    Resolution of the mask, 12 for pitch classes, 24 for quarter tones.
+        threshold (float):         Pitches further than this from a step [semitones] are left out.
+    """
+    positions = numpy.asarray(pitches, dtype=float) * steps_per_octave / 12.0
+    nearest = numpy.round(positions)
+    steps = nearest[numpy.abs(positions - nearest) * 12.0 / steps_per_octave < threshold].astype(int) % steps_per_octave
+    mask = 0
+    for step in set(steps.tolist()):
+        mask |= 1 << step
+    return mask
+
+
+class JinsIndex:
+    def __init__(self, ajnas: Dict[str, Jins], *, steps_per_octave: int = 24):
+        """Index of a jins catalog for lookups by pitch set, by interval pattern and by containment,
+        instead of scanning the whole catalog.
+
+        Every jins is reduced to a bitmask of the steps its pitches fall on (see `pitch_mask`).
+        Exact and interval pattern lookups are hash lookups on the mask and on its smallest rotation.
+        Containment queries use an inverted index from each step to the set of ajnas on that step,
+        kept as one integer bitset over the catalog, so a query costs one AND/OR per step.
+
+        Args:
+            ajnas (Dict[str, Jins]): The catalog, e.g. maqamator.arabic_ajnas or thousands of generated scales.
+            steps_per_octave (int):  Resolution of the masks, 24 keeps the quarter tones apart.
+        """
+        self.names = list(ajnas)
+        self.steps_per_octave = steps_per_octave
+        self.masks = [pitch_mask(jins.compile().pitches, steps_per_octave=steps_per_octave) for jins in ajnas.values()]
+        self._by_mask: Dict[int, List[int]] = dict()
+        self._by_signature: Dict[int, List[int]] = dict()
+        self._postings = [0] * steps_per_octave
+        for ix, mask in enumerate(self.masks):
+            self._by_mask.setdefault(mask, []).append(ix)
+            self._by_signature.setdefault(self._signature(mask), []).append(ix)
+            for step in range(steps_per_octave):
+                if mask >> step & 1:
+                    self._postings[step] |= 1 << ix
+        self._everything = (1 << len(self.names)) - 1
+
+    def __len__(self):
+        return len(self.names)
+
+    def _rotate(self, mask: int, steps: int) -> int:
+        """Transpose a mask up by a number of steps."""
+        steps %= self.steps_per_octave
+        full = (1 << self.steps_per_octave) - 1
+        return ((mask << steps) | (mask >> (self.steps_per_octave - steps))) & full
+
+    def _signature(self, mask: int) -> int:
+        return min(self._rotate(mask, steps) for steps in range(self.steps_per_octave))
+
+    def _mask(self, pitches: Sequence[float]) -> int:
+        return pitch_mask(pitches, steps_per_octave=self.steps_per_octave)
+
+    def _names(self, bitset: int) -> List[str]:
+        names = []
+        while bitset:
+            lowest = bitset & -bitset
+            names.append(self.names[lowest.bit_length() - 1])
+            bitset ^= lowest
+        return names
+
+    def _transposed(self, query: Callable[[int], int], mask: int) -> List[Tuple[str, float]]:
+        """Run a bitset query for every transposition of mask, as (name, transposition [semitones]) pairs."""
+        found = []
+        for steps in range(self.steps_per_octave):
+            for name in self._names(query(self._rotate(mask, -steps))):
+                found.append((name, steps * 12.0 / self.steps_per_octave))
+        return found
+
+    def _containing(self, mask: int) -> int:
+        bitset = self._everything
+        for step in range(self.steps_per_octave):
+            if mask >> step & 1:
+                bitset &= self._postings[step]
+        return bitset
+
+    def _contained_in(self, mask: int) -> int:
+        outside = 0
+        for step in range(self.steps_per_octave):
+            if not mask >> step & 1:
+                outside |= self._postings[step]
+        return self._everything & ~outside
+
+    def by_pitches(self, pitches: Sequence[float]) -> List[str]:
+        """The ajnas with exactly these pitch classes."""
+        return [self.names[ix] for ix in self._by_mask.get(self._mask(pitches), [])]
+
+    def by_intervals(self, pitches: Sequence[float]) -> List[Tuple[str, float]]:
+        """The ajnas with the same interval pattern as the pitches in some transposition.
+
+        Returns:
+            List[Tuple[str, float]]: (name, transposition [semitones]), where the jins transposed up by
+                                     the transposition has the pitch classes of the query.
+        """
+        mask = self._mask(pitches)
+        found = []
+        for ix in self._by_signature.get(self._signature(mask), []):
+            for steps in range(self.steps_per_octave):
+                if self._rotate(self.masks[ix], steps) == mask:
+                    found.append((self.names[ix], steps * 12.0 / self.steps_per_octave))
+        return found
+
+    def containing(self, pitches: Sequence[float], *, transpose: bool = False):
+        """The ajnas (scales) that contain all the pitch classes of the query.
+
+        Args:
+            pitches (Sequence[float]): The query, e.g. the pitches of a jins.
+            transpose (bool):          Also find them in every other transposition of the query,
+                                       then (name, transposition [semitones]) pairs are returned.
+        """
+        if transpose:
+            return self._transposed(self._containing, self._mask(pitches))
+        return self._names(self._containing(self._mask(pitches)))
+
+    def contained_in(self, pitches: Sequence[float], *, transpose: bool = False):
+        """The ajnas whose pitch classes are all among the pitch classes of the query, e.g. the ajnas of a scale.
+
+        Args:
+            pitches (Sequence[float]): The query, e.g. the pitches of a maqam.
+            transpose (bool):          Also find them in every other transposition of the query,
+                                       then (name, transposition [semitones]) pairs are returned.
+        """
+        if transpose:
+            return self._transposed(self._contained_in, self._mask(pitches))
+        return self._names(self._contained_in(self._mask(pitches)))
+
 
 class TurkishChord:
     def __init__(self, *, intervals: str, guclu: int | None = None):
@@ -176,8 +412,7 @@ def letters(jins: Jins, zero_letter: str, zero_octave: int = 4, octave_letter: s
     ]
     zero_index = quartertone_symbols.index(f"{zero_letter[0]}♮")
     octave_index = quartertone_symbols.index(f"{octave_letter[0]}♮")
-    notes = sorted(set(jins.pitches + jins.extension_pitches + jins.modulation_pitches + jins.tonics))
-    for note in notes:
+    for note in jins.compile().notes.tolist():
         quartertone_number = (note / jins.wholestep) * 4.0 + zero_index
         decimalpart = quartertone_number - int(quartertone_number)
         if decimalpart <= -0.5:
@@ -1,34 +1,434 @@
+import argparse
+import collections
+import contextlib
+import functools
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
 import pathlib
-from musikteori.maqamator import arabic_ajnas
+import sys
+import time
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from musikteori.cache_files import write_atomically
+from musikteori.maqamator import Jins, arabic_ajnas
 
+import numpy
 import pretty_midi
 
+MIDI_SUFFIXES = {".mid", ".midi", ".kar"}
+
+
+class JinsTemplates:
+    def __init__(self, ajnas: Dict[str, Jins], *, bins_per_octave: int = 12, threshold: float = 0.25):
+        """The ajnas compiled into a template matrix, so that a chroma vector is scored against every jins
+        in every transposition with a single matrix product.
+
+        Args:
+            ajnas (Dict[str, Jins]):  The ajnas to match against.
+            bins_per_octave (int):    Resolution of the chroma vectors to score (12, 24, 53, ...).
+            threshold (float):        Pitches further than this from a bin [semitones] are left out of the template,
+                                      e.g. the neutral steps of Bayati or Rast when bins_per_octave is 12.
+        """
+        self.names = list(ajnas)
+        self.bins_per_octave = bins_per_octave
+        # templates[jins, bin] is the number of jins pitches in that bin
+        self.templates = numpy.zeros((len(ajnas), bins_per_octave))
+        for row, jins in enumerate(ajnas.values()):
+            positions = jins.compile().pitches * bins_per_octave / 12.0
+            nearest = numpy.round(positions)
+            kept = nearest[numpy.abs(positions - nearest) * 12.0 / bins_per_octave < threshold]
+            numpy.add.at(self.templates[row], kept.astype(int) % bins_per_octave, 1)
+        # shifted[jins, shift, bin] = templates[jins, bin - shift], flattened to (jins * shift, bin)
+        bins = numpy.arange(bins_per_octave)
+        self._shifted = self.templates[:, (bins[numpy.newaxis, :] - bins[:, numpy.newaxis]) % bins_per_octave]
+        self._shifted = self._shifted.reshape(-1, bins_per_octave)
+
+    def scores(self, chroma) -> numpy.ndarray:
+        """Score chroma vectors against every jins in every transposition.
+
+        Args:
+            chroma: One chroma vector (bins_per_octave,) or a stack of them (..., bins_per_octave).
+
+        Returns:
+            numpy.ndarray: The score table (..., jins, shift), where shift is in bins.
+        """
+        chroma = numpy.asarray(chroma, dtype=float)
+        return (chroma @ self._shifted.T).reshape(*chroma.shape[:-1], len(self.names), self.bins_per_octave)
+
+    def ranking(self, chroma, k: Optional[int] = None) -> List[Tuple[str, int, float]]:
+        """The k best (name, shift, score) for one chroma vector, best first. All of them if k is None."""
+        scores = self.scores(chroma).ravel()
+        order = numpy.argsort(-scores, kind="stable")[:k]
+        return [
+            (self.names[ix // self.bins_per_octave], int(ix % self.bins_per_octave), float(scores[ix])) for ix in order
+        ]
+
+    def tonic_name(self, shift: int) -> str:
+        """Name of the pitch class a shift [bins] transposes C to, with cents if it falls between semitones."""
+        semitones = shift * 12.0 / self.bins_per_octave
+        nearest = round(semitones)
+        name = pretty_midi.utilities.note_number_to_name(nearest % 12)[:-2]
+        if cents := round(100.0 * (semitones - nearest)):
+            name += f"{cents:+d}¢"
+        return name
+
+
+@functools.lru_cache()
+def arabic_templates(bins_per_octave: int = 12) -> JinsTemplates:
+    return JinsTemplates(arabic_ajnas, bins_per_octave=bins_per_octave)
+
+
+class MidiFeatures:
+    def __init__(self, *, chroma: numpy.ndarray, notes: numpy.ndarray, note_count: int):
+        """What the analyses need from a parsed MIDI file, small enough to be cached (see `FeatureCache`).
+
+        Args:
+            chroma (numpy.ndarray): The 12 bin chroma of the piano roll, pretty_midi's get_chroma() summed over time.
+            notes (numpy.ndarray):  The note table, see `note_table`.
+            note_count (int):       Number of notes, drums included.
+        """
+        self.chroma = chroma
+        self.notes = notes
+        self.note_count = note_count
+
+    @classmethod
+    def from_midi(cls, midi_data: pretty_midi.PrettyMIDI):
+        return cls(
+            chroma=midi_data.get_chroma().sum(axis=1),
+            notes=note_table(midi_data),
+            note_count=sum(len(instrument.notes) for instrument in midi_data.instruments),
+        )
+
+
+def note_table(midi_data: Union[pretty_midi.PrettyMIDI, MidiFeatures]) -> numpy.ndarray:
+    """The notes of all instruments except drums.
+
+    Returns:
+        numpy.ndarray: (start [s], end [s], pitch, velocity, pitch bend) per note, (5, nof_notes),
+                       where pitch bend is the raw value (-8192..8191) active when the note starts.
+    """
+    if isinstance(midi_data, MidiFeatures):
+        return midi_data.notes
+    notes = [numpy.zeros((5, 0))]
+    for instrument in midi_data.instruments:
+        if instrument.is_drum or not instrument.notes:
+            continue
+        starts, ends, pitches, velocities = numpy.array(
+            [(note.start, note.end, note.pitch, note.velocity) for note in instrument.notes]
+        ).T
+        bends = numpy.zeros_like(pitches)
+        if instrument.pitch_bends:
+            bend_times, bend_values = numpy.array([(bend.time, bend.pitch) for bend in instrument.pitch_bends]).T
+            order = numpy.argsort(bend_times, kind="stable")
+            active = numpy.searchsorted(bend_times[order], starts, side="right") - 1
+            bends = numpy.where(active >= 0, bend_values[order][active], 0)
+        notes.append(numpy.stack([starts, ends, pitches, velocities, bends]))
+    return numpy.concatenate(notes, axis=1)
+
+
+def bent_notes(midi_data: Union[pretty_midi.PrettyMIDI, MidiFeatures], *, semitone_range: float = 2.0) -> numpy.ndarray:
+    """The notes of all instruments except drums, with every note moved by the pitch bend active when it starts.
+
+    Args:
+        midi_data (Union[pretty_midi.PrettyMIDI, MidiFeatures]): The parsed (or cached) MIDI.
+        semitone_range (float):                                  The pitch bend range of the instruments [semitones].
+
+    Returns:
+        numpy.ndarray: (start [s], end [s], fractional pitch, velocity) per note, (4, nof_notes).
+    """
+    starts, ends, pitches, velocities, bends = note_table(midi_data)
+    return numpy.stack([starts, ends, pitches + bends * semitone_range / 8192.0, velocities])
+
+
+def pitch_bend_chroma(
+    midi_data: Union[pretty_midi.PrettyMIDI, MidiFeatures], *, bins_per_octave: int = 24, semitone_range: float = 2.0
+) -> numpy.ndarray:
+    """Chroma with microtonal resolution, where every note is moved by the pitch bend active when it starts.
+
+    Args:
+        midi_data (Union[pretty_midi.PrettyMIDI, MidiFeatures]): The parsed (or cached) MIDI.
+        bins_per_octave (int):      Resolution of the chroma, e.g. 24 for quarter tones or 53 for Holdrian commas.
+        semitone_range (float):     The pitch bend range of the instruments [semitones].
+
+    Returns:
+        numpy.ndarray: The energy (velocity * seconds) per bin, (bins_per_octave,). Drums are left out.
+    """
+    starts, ends, pitches, velocities = bent_notes(midi_data, semitone_range=semitone_range)
+    bins = numpy.round(pitches * bins_per_octave / 12.0).astype(int) % bins_per_octave
+    return numpy.bincount(bins, weights=velocities * (ends - starts), minlength=bins_per_octave)
+
+
+def windowed_similars(
+    midi_data: Union[pretty_midi.PrettyMIDI, MidiFeatures],
+    templates: Optional[JinsTemplates] = None,
+    *,
+    window: float = 8.0,
+    hop: float = 1.0,
+    semitone_range: float = 2.0,
+) -> Iterator[Tuple[float, str, str, float]]:
+    """Follow the jins through a piece by matching sliding windows, e.g. to see the modulations of a taqsim.
+
+    The notes are walked in time order and their energy is spread over hop sized slots. The window chroma is kept
+    as a running sum where the newest slot is added and the oldest removed, so no piano roll is built: besides the
+    note table, which is O(notes) like the parsed MIDI itself, only the slots of one window (plus those of notes still
+    sounding) are held in memory.
+
+    Args:
+        midi_data (Union[pretty_midi.PrettyMIDI, MidiFeatures]): The parsed (or cached) MIDI.
+        templates (Optional[JinsTemplates]): The ajnas to match, the arabic ajnas at 12 bins if None.
+        window (float):                      Length of a window [s].
+        hop (float):                         Time between window starts [s].
+        semitone_range (float):              The pitch bend range of the instruments [semitones].
+
+    Yields:
+        Tuple[float, str, str, float]: (window start [s], best jins, tonic, score). Silent windows are skipped.
+    """
+    templates = arabic_templates() if templates is None else templates
+    bins_per_octave = templates.bins_per_octave
+    notes = bent_notes(midi_data, semitone_range=semitone_range)
+    starts, ends, pitches, velocities = notes[:, numpy.argsort(notes[0], kind="stable")]
+    bins = numpy.round(pitches * bins_per_octave / 12.0).astype(int) % bins_per_octave
+    slots_per_window = max(1, round(window / hop))
+    nof_slots = int(numpy.ceil(ends.max() / hop)) if len(ends) else 0
+
+    pending: Dict[int, numpy.ndarray] = collections.defaultdict(lambda: numpy.zeros(bins_per_octave))
+    recent: Deque[numpy.ndarray] = collections.deque()
+    running = numpy.zeros(bins_per_octave)
+    note_ix = 0
+    for slot in range(max(nof_slots, slots_per_window) if nof_slots else 0):
+        # add the energy of the notes starting in this slot to every slot they sound in
+        while note_ix < len(starts) and starts[note_ix] < (slot + 1) * hop:
+            start, end = starts[note_ix], ends[note_ix]
+            for note_slot in range(int(start // hop), int(end // hop) + 1):
+                overlap = min(end, (note_slot + 1) * hop) - max(start, note_slot * hop)
+                if overlap > 0:
+                    pending[note_slot][bins[note_ix]] += velocities[note_ix] * overlap
+            note_ix += 1
+        energy = pending.pop(slot, numpy.zeros(bins_per_octave))
+        running += energy
+        recent.append(energy)
+        if len(recent) > slots_per_window:
+            running -= recent.popleft()
+        if len(recent) < slots_per_window:
+            continue
+        running = numpy.maximum(running, 0.0)  # round-off from removing slots
+        if (total := running.sum()) > 0:
+            name, shift, score = templates.ranking(running / total, 1)[0]
+            yield (slot + 1 - slots_per_window) * hop, name, templates.tonic_name(shift), score
+
+
+class FeatureCache:
+    version = 1
+
+    def __init__(self, directory: pathlib.Path, max_bytes: int = 1 << 30):
+        """Keeps the `MidiFeatures` of parsed MIDI files as compressed .npz files, keyed by a hash of the file content,
+        so that repeated analyses of an unchanged corpus skip the MIDI parsing.
+
+        Args:
+            directory (pathlib.Path): Where to keep the cached features. Created if missing.
+            max_bytes (int):          The least recently used entries are removed when the cache grows beyond this.
+        """
+        self.directory = pathlib.Path(directory)
+        self.max_bytes = max_bytes
+        self._size: Optional[int] = None  # of the entries, as far as this process knows, None until first counted
+
+    def key(self, path: pathlib.Path) -> str:
+        digest = hashlib.sha256(f"{self.version}".encode())
+        with open(path, "rb") as f:
+            while chunk := f.read(1 << 20):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def load(self, path: pathlib.Path) -> MidiFeatures:
+        """The features of a MIDI file, parsing the file only if they are not cached yet."""
+        entry = self.directory / f"{self.key(path)}.npz"
+        if entry.is_file():
+            with contextlib.suppress(OSError, ValueError, KeyError):
+                with numpy.load(entry) as data:
+                    features = MidiFeatures(
+                        chroma=data["chroma"], notes=data["notes"], note_count=int(data["note_count"])
+                    )
+                os.utime(entry)  # recently used
+                return features
+        features = MidiFeatures.from_midi(pretty_midi.PrettyMIDI(str(path)))
+        if write_atomically(
+            entry,
+            lambda f: numpy.savez_compressed(
+                f, chroma=features.chroma, notes=features.notes, note_count=features.note_count
+            ),
+        ):
+            self._added(entry)
+        return features
+
+    def _entries(self) -> List[Tuple[float, int, pathlib.Path]]:
+        entries = []
+        for entry in self.directory.glob("*.npz"):
+            with contextlib.suppress(FileNotFoundError):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry))
+        return entries
+
+    def _added(self, entry: pathlib.Path):
+        """Count a new entry in the running size, and evict only when that goes beyond max_bytes.
+
+        The directory is listed the first time only, so that filling the cache stays linear in the number of entries.
+        Entries written by other processes are not counted, see `analyze_corpus`.
+        """
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+        else:
+            with contextlib.suppress(FileNotFoundError):
+                self._size += entry.stat().st_size
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits in max_bytes."""
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries, key=lambda item: item[0]):
+            if total <= self.max_bytes:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                entry.unlink()
+            total -= size
+        self._size = total
+
 
 class MidiJinsAnalyzer:
-    def __init__(self, path: pathlib.Path):
-        self.midi_data = pretty_midi.PrettyMIDI(str(path))
-        total_velocity = sum(sum(self.midi_data.get_chroma()))
-        self.relative_chroma = [sum(semitone) / total_velocity for semitone in self.midi_data.get_chroma()]
+    def __init__(
+        self,
+        path: pathlib.Path,
+        templates: Optional[JinsTemplates] = None,
+        cache: Optional[FeatureCache] = None,
+    ):
+        self.path = pathlib.Path(path)
+        self.features = MidiFeatures.from_midi(self.midi_data) if cache is None else cache.load(self.path)
+        self.note_count = self.features.note_count
+        if (total := self.features.chroma.sum()) <= 0:
+            raise ValueError(f"{self.path} has no pitched notes to match")
+        self.relative_chroma = (self.features.chroma / total).tolist()
+        self.templates = arabic_templates() if templates is None else templates
+        if self.templates.bins_per_octave == 12:
+            self.chroma = numpy.asarray(self.relative_chroma)
+        else:
+            chroma = pitch_bend_chroma(self.features, bins_per_octave=self.templates.bins_per_octave)
+            if (total := chroma.sum()) <= 0:
+                raise ValueError(f"{self.path} has no pitched notes to match")
+            self.chroma = chroma / total
+
+    @functools.cached_property
+    def midi_data(self) -> pretty_midi.PrettyMIDI:
+        """The parsed MIDI, only parsed when asked for if the features came from a cache."""
+        return pretty_midi.PrettyMIDI(str(self.path))
 
     def get_top_similars(self):
-        similars = dict()
-        for shift in range(12):
-            for key, value in self._get_shifted_similars(shift).items():
-                if similars.get(key, (shift, 0))[-1] < value:
-                    similars[key] = (shift, value)
-        max_value = max([value for _, value in similars.values()])
-        return {name: (pretty_midi.utilities.note_number_to_name(shift)[0], value) for name, (shift, value) in similars.items() if value == max_value}
-
-    def _get_shifted_similars(self, shift=0):
-        similarities = dict()
-        for name, jins in arabic_ajnas.items():
-            pitches = [(pitch + shift) % 12 for pitch in jins.pitches]
-            weight = 0
-            for pitch in pitches:
-                # TODO: can this be done for quarter tones etc if it is computed using pitch bends etc ?
-                if pitch == int(pitch):
-                    weight += self.relative_chroma[pitch]
-            similarities[name] = float(weight)
-
-        max_value = max(similarities.values())
-        return {name: value for name, value in similarities.items() if value == max_value}
+        """The best scoring ajnas (several if tied) with their tonic and score."""
+        scores = self.templates.scores(self.chroma)
+        best_shifts = numpy.argmax(scores, axis=-1)
+        best_scores = numpy.take_along_axis(scores, best_shifts[:, numpy.newaxis], axis=-1)[:, 0]
+        return {
+            name: (self.templates.tonic_name(int(shift)), float(score))
+            for name, shift, score in zip(self.templates.names, best_shifts, best_scores)
+            if numpy.isclose(score, best_scores.max())
+        }
+
+
+def iter_midi_paths(pattern: str) -> Iterator[pathlib.Path]:
+    """Yield the MIDI files below a directory (recursively), or the files matching a glob pattern.
+
+    Args:
+        pattern (str): A directory, or a glob pattern such as "G:/Musik/**/*.mid".
+    """
+    if (directory := pathlib.Path(pattern)).is_dir():
+        paths = sorted(path for path in directory.rglob("*") if path.suffix.lower() in MIDI_SUFFIXES)
+    else:
+        paths = sorted(pathlib.Path(path) for path in glob.glob(pattern, recursive=True))
+    yield from (path for path in paths if path.is_file())
+
+
+def analyze_file(path: pathlib.Path, bins_per_octave: int = 12, cache: Optional[FeatureCache] = None) -> Dict:
+    """Analyze a single MIDI file into a json-friendly record.
+
+    Files that can not be parsed or analyzed give a record with an "error" entry instead of raising,
+    so that one corrupt file does not stop a corpus run.
+    """
+    try:
+        analyzer = MidiJinsAnalyzer(path, arabic_templates(bins_per_octave), cache)
+        similars = analyzer.get_top_similars()
+        name, (tonic, score) = max(similars.items(), key=lambda item: item[1][1])
+        return {
+            "path": str(path),
+            "jins": name,
+            "tonic": tonic,
+            "score": score,
+            "ties": sorted(similars),
+            "notes": analyzer.note_count,
+        }
+    except Exception as error:
+        return {"path": str(path), "error": f"{type(error).__name__}: {error}"}
+
+
+def analyze_corpus(
+    paths: Iterable[pathlib.Path],
+    *,
+    processes: Optional[int] = None,
+    bins_per_octave: int = 12,
+    cache: Optional[FeatureCache] = None,
+) -> Iterator[Dict]:
+    """Analyze MIDI files in a process pool, yielding each record (see `analyze_file`) as soon as its file is done.
+
+    Args:
+        paths (Iterable[pathlib.Path]): The MIDI files.
+        processes (Optional[int]):      Number of worker processes, all cores if None. 1 analyzes in this process.
+        bins_per_octave (int):          Chroma resolution, above 12 the pitch bends are taken into account.
+        cache (Optional[FeatureCache]): Reuse the features of files that were parsed before. It is brought back
+                                        within its max_bytes when all files are done.
+    """
+    analyze = functools.partial(analyze_file, bins_per_octave=bins_per_octave, cache=cache)
+    if processes == 1:
+        yield from map(analyze, paths)
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            yield from pool.imap_unordered(analyze, paths)
+    if cache is not None:
+        cache.evict()  # each worker only counted the entries it wrote itself
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Find the best matching jins for every MIDI file in a corpus, one json record per line.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("corpus", help="A directory (searched recursively) or a glob pattern of MIDI files")
+    parser.add_argument("--processes", default=None, type=int, help="Number of worker processes (default: all cores)")
+    parser.add_argument(
+        "--bins-per-octave", default=12, type=int, help="Chroma resolution, e.g. 24 or 53 to use pitch bends"
+    )
+    parser.add_argument("--cache-dir", default=None, type=pathlib.Path, help="Cache the parsed MIDI features here")
+    parser.add_argument("--cache-max-mb", default=1024, type=int, help="Size limit of the feature cache")
+    parser.add_argument("--output", default=None, type=pathlib.Path, help="Write json lines here instead of stdout")
+    args = parser.parse_args()
+
+    cache = None if args.cache_dir is None else FeatureCache(args.cache_dir, max_bytes=args.cache_max_mb << 20)
+    nof_files = nof_failed = nof_notes = 0
+    start = time.perf_counter()
+    with open(args.output, "w", encoding="utf-8") if args.output else contextlib.nullcontext(sys.stdout) as output:
+        for record in analyze_corpus(
+            iter_midi_paths(args.corpus),
+            processes=args.processes,
+            bins_per_octave=args.bins_per_octave,
+            cache=cache,
+        ):
+            print(json.dumps(record, ensure_ascii=False), file=output, flush=True)
+            nof_files += 1
+            nof_failed += "error" in record
+            nof_notes += record.get("notes", 0)
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    print(
+        f"{nof_files} files ({nof_failed} failed), {nof_notes} notes in {elapsed:.2f}s: "
+        f"{nof_files / elapsed:.1f} files/s, {nof_notes / elapsed:.0f} notes/s",
+        file=sys.stderr,
+    )
@@ -0,0 +1,89 @@
+import functools
+from typing import Dict, List, Optional, Sequence
+
+import numpy
+
+from musikteori.scale_names import scale_names
+
+STEPS = 12
+SIZE = 1 << STEPS
+MASK = SIZE - 1
+
+
+class PitchClassSets:
+    def __init__(self):
+        """All 4096 sets of pitch classes, indexed by scale id: bit i of the id is set if pitch class i is in the set
+        (as on https://ianring.com/musictheory/scales/).
+
+        Attributes:
+            bits (numpy.ndarray):            1 where the pitch class is in the set, (4096, 12).
+            counts (numpy.ndarray):          Number of pitch classes in the set, (4096,).
+            semitones (List[Tuple]):         The pitch classes of each set, ascending.
+            representations (List[str]):     The pitch classes spelled out on a line of 12 frets, e.g. "0--2".
+            digit_positions (numpy.ndarray): Where the digits are in the representation, padded with -1, (4096, 14).
+            digit_counts (numpy.ndarray):    Number of digits in the representation (10 and 11 have two), (4096,).
+            highest (numpy.ndarray):         The highest pitch class in the set, -1 if empty, (4096,).
+            rotations (numpy.ndarray):       The id of the set transposed down by k semitones at [id, k], (4096, 12).
+            inversions (numpy.ndarray):      The id of the set mirrored around pitch class 0, (4096,).
+            normal_forms (numpy.ndarray):    The lowest id among the transpositions of the set, (4096,).
+            prime_forms (numpy.ndarray):     The lowest id among the transpositions of the set and of its inversion.
+        """
+        ids = numpy.arange(SIZE)
+        steps = numpy.arange(STEPS)
+        self.bits = ((ids[:, numpy.newaxis] >> steps) & 1).astype(numpy.uint8)
+        self.counts = self.bits.sum(axis=1)
+        self.semitones = [tuple(numpy.flatnonzero(row).tolist()) for row in self.bits]
+        self.representations = [self._representation(semitones) for semitones in self.semitones]
+        self.digit_counts = numpy.array([sum(char.isdigit() for char in text) for text in self.representations])
+        self.digit_positions = numpy.full((SIZE, self.digit_counts.max()), -1, dtype=numpy.int16)
+        for scale_id, text in enumerate(self.representations):
+            positions = [ix for ix, char in enumerate(text) if char.isdigit()]
+            self.digit_positions[scale_id, : len(positions)] = positions
+        self.highest = numpy.where(self.counts > 0, STEPS - 1 - numpy.argmax(self.bits[:, ::-1], axis=1), -1)
+        self.rotations = ((ids[:, numpy.newaxis] >> steps) | (ids[:, numpy.newaxis] << (STEPS - steps))) & MASK
+        self.inversions = (self.bits[:, -steps % STEPS].astype(int) << steps).sum(axis=1)
+        self.normal_forms = self.rotations.min(axis=1)
+        self.prime_forms = numpy.minimum(self.normal_forms, self.normal_forms[self.inversions])
+        arrays = [self.digit_positions, self.digit_counts, self.highest]
+        for array in arrays + [
+            self.bits,
+            self.counts,
+            self.rotations,
+            self.inversions,
+            self.normal_forms,
+            self.prime_forms,
+        ]:
+            array.flags.writeable = False
+
+    @staticmethod
+    def _representation(semitones: Sequence[int]) -> str:
+        return "".join(f"{position}-" if position in semitones else "-" for position in range(STEPS)).strip("-")
+
+    @staticmethod
+    def scale_id(semitones: Sequence[int]) -> Optional[int]:
+        """The id of a set of pitch classes, None if they are not all integers in [0, 12)."""
+        scale_id = 0
+        for semitone in semitones:
+            if semitone != int(semitone) or not 0 <= semitone < STEPS:
+                return None
+            scale_id |= 1 << int(semitone)
+        return scale_id
+
+    def modes(self, scale_id: int) -> List[int]:
+        """The ids of the set transposed so that each of its pitch classes in turn is 0, starting from the lowest."""
+        return self.rotations[scale_id, list(self.semitones[scale_id])].tolist()
+
+    def name(self, scale_id: int) -> Optional[str]:
+        """The name of the set, as in the fingering charts, None if it has none."""
+        return scale_names().names.get(scale_id)
+
+
+@functools.lru_cache
+def pitch_class_sets() -> PitchClassSets:
+    """The table of all pitch class sets, built once."""
+    return PitchClassSets()
+
+
+def load_scale_names() -> Dict[int, str]:
+    """Names by scale id: from dozenal.json, or from scales.json where the dozenal name is not plain ascii."""
+    return scale_names().names
@@ -1,4 +1,12 @@
+import argparse
 import collections
+import contextlib
+import functools
+import hashlib
+import heapq
+import json
+import math
+import multiprocessing
 import os
 import pathlib
 import sys
@@ -11,8 +19,632 @@ if sys.platform == "win32":
         os.environ["PATH"] += f";{path}"
 
 import networkx
-import maqamator
-from typing import Dict, List
+from musikteori import maqamator, sayr_diagram
+from musikteori.cache_files import write_atomically
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+
+def similarity_scores(source_pitches, dest_pitches, threshold: float = 0.25, *, optimal: bool = False) -> numpy.ndarray:
+    """Count how many source pitches can be paired with a distinct destination pitch of the same pitch class.
+
+    All pitch class distances are computed at once as a (..., source, dest) matrix. The default greedy matching
+    pairs the source pitches in order, each with the closest unused destination pitch within the threshold,
+    looping over the source pitches but vectorized over the whole batch of destinations.
+
+    Args:
+        source_pitches:    The source pitches [semitones], (n,).
+        dest_pitches:      One set of destination pitches (m,) or a batch of them (..., m), padded with nan.
+        threshold (float): Pitches closer than this [semitones] (modulo the octave) are the same pitch class.
+        optimal (bool):    Use a maximum matching instead (scipy's linear_sum_assignment), which can pair more.
+
+    Returns:
+        numpy.ndarray: The number of pairs, an int array with the batch shape (...).
+    """
+    source = numpy.asarray(source_pitches, dtype=float) % 12.0
+    dest = numpy.asarray(dest_pitches, dtype=float) % 12.0
+    distances = numpy.abs(source[:, numpy.newaxis] - dest[..., numpy.newaxis, :])
+    distances = numpy.minimum(distances, 12.0 - distances)  # the short way around the octave
+    distances = numpy.where(distances < threshold, distances, numpy.inf)  # nan padding never matches
+    matched = numpy.zeros(dest.shape[:-1], dtype=int)
+    if len(source) == 0 or dest.shape[-1] == 0:
+        return matched
+    if optimal:
+        import scipy.optimize  # slow to import, and only needed here
+
+        flat_distances = distances.reshape(-1, *distances.shape[-2:])
+        for ix, pair_distances in enumerate(flat_distances):
+            rows, cols = scipy.optimize.linear_sum_assignment(numpy.isinf(pair_distances))
+            matched.flat[ix] = numpy.count_nonzero(numpy.isfinite(pair_distances[rows, cols]))
+        return matched
+    used = numpy.zeros(dest.shape, dtype=bool)
+    for ix in range(len(source)):
+        candidates = numpy.where(used, numpy.inf, distances[..., ix, :])
+        closest = numpy.argmin(candidates, axis=-1)[..., numpy.newaxis]
+        found = numpy.isfinite(numpy.take_along_axis(candidates, closest, axis=-1))
+        numpy.put_along_axis(used, closest, found | numpy.take_along_axis(used, closest, axis=-1), axis=-1)
+        matched += found[..., 0]
+    return matched
+
+
+def similarity_score(source_pitches, dest_pitches, threshold: float = 0.25, *, optimal: bool = False) -> int:
+    """`similarity_scores` for a single set of destination pitches."""
+    return int(similarity_scores(source_pitches, dest_pitches, threshold, optimal=optimal))
+
+
+class Modulation(NamedTuple):
+    """The best way to modulate from a source jins to a destination jins, relative to the root of the source."""
+
+    tonic_offset: float  # destination tonic pitch - source root pitch
+    root_offset: float  # destination root pitch - source root pitch
+    modulation_index: int  # index of the modulation point in the source pitches
+    similarity: float
+
+
+class ModulationBounds:
+    def __init__(self, predecessors: Dict[str, List[str]], max_similarity: float, max_root_offset: float):
+        """What `best_paths` bounds the remaining cost with, computed once per catalog (see `Modulations.bounds`).
+
+        Args:
+            predecessors (Dict[str, List[str]]): The ajnas that can be modulated from to each jins.
+            max_similarity (float):              The highest similarity of any modulation, 0 if there is none.
+            max_root_offset (float):             The highest root offset of any modulation, 0 if there is none.
+        """
+        self.predecessors = predecessors
+        self.max_similarity = max_similarity
+        self.max_root_offset = max_root_offset
+        self._hops: Dict[str, Dict[str, int]] = dict()
+
+    def hops(self, target: str) -> Dict[str, int]:
+        """The fewest modulations from each jins to the target, for the ajnas that can reach it at all."""
+        if target not in self._hops:
+            hops = {target: 0}
+            queue = collections.deque([target])
+            while queue:
+                name = queue.popleft()
+                for predecessor in self.predecessors.get(name, []):
+                    if predecessor not in hops:
+                        hops[predecessor] = hops[name] + 1
+                        queue.append(predecessor)
+            self._hops[target] = hops
+        return self._hops[target]
+
+
+class ModulationCache:
+    def __init__(self, ajnas: Dict[str, maqamator.Jins]):
+        """Best modulations between pairs of ajnas, each pair computed once.
+
+        The similarity of two ajnas only depends on their pitches modulo the octave, so the best modulation is the
+        same wherever the source sits and can be shared between every node (and every depth) of a sayr.
+
+        Args:
+            ajnas (Dict[str, maqamator.Jins]): The catalog to modulate within.
+        """
+        self.ajnas = ajnas
+        self._best: Dict[Tuple[str, str], Optional[Modulation]] = dict()
+        self._candidates: Dict[str, List[Tuple[str, Modulation]]] = dict()
+        self._bounds: Optional[ModulationBounds] = None
+
+    def best(self, source_name: str, dest_name: str) -> Optional[Modulation]:
+        """The best modulation from source to dest, None if there is none that rises and shares pitches."""
+        if (source_name, dest_name) not in self._best:
+            self._compute(source_name, [dest_name])
+        return self._best[(source_name, dest_name)]
+
+    def candidates(self, source_name: str) -> List[Tuple[str, Modulation]]:
+        """(dest name, modulation) for every other jins that can be modulated to, most similar first."""
+        if source_name not in self._candidates:
+            self._compute(source_name, [name for name in self.ajnas if (source_name, name) not in self._best])
+            candidates = []
+            for dest_name in self.ajnas:
+                if dest_name != source_name and (modulation := self._best[(source_name, dest_name)]) is not None:
+                    candidates.append((dest_name, modulation))
+            self._candidates[source_name] = sorted(candidates, key=lambda item: item[1].similarity, reverse=True)
+        return self._candidates[source_name]
+
+    def bounds(self) -> ModulationBounds:
+        """The bounds of the whole catalog, which takes the candidates of every jins the first time."""
+        if self._bounds is None:
+            predecessors = collections.defaultdict(list)
+            max_similarity, max_root_offset = 0.0, 0.0
+            for name in self.ajnas:
+                for dest_name, modulation in self.candidates(name):
+                    predecessors[dest_name].append(name)
+                    max_similarity = max(max_similarity, modulation.similarity)
+                    max_root_offset = max(max_root_offset, modulation.root_offset)
+            self._bounds = ModulationBounds(dict(predecessors), max_similarity, max_root_offset)
+        return self._bounds
+
+    def with_jins(self, ajnas: Dict[str, maqamator.Jins], name: str) -> "ModulationCache":
+        """A cache for a catalog where only the named jins was added, changed or removed.
+
+        The modulations between the other ajnas are kept, the ones to and from the named jins computed when asked for.
+        """
+        cache = ModulationCache(ajnas)
+        cache._best = {pair: modulation for pair, modulation in self._best.items() if name not in pair}
+        return cache
+
+    def _compute(self, source_name: str, dest_names: List[str]):
+        """Score every (source modulation point, dest modulation point) of every destination in one batch."""
+        source_jins = self.ajnas[source_name]
+        rows = []  # (dest ix, tonic offset, root offset, source modulation)
+        for dest_ix, dest_name in enumerate(dest_names):
+            dest_jins = self.ajnas[dest_name]
+            for source_modulation in source_jins.modulation_pitches:
+                for dest_modulation in dest_jins.modulation_pitches:
+                    tonic_offset = source_modulation - dest_modulation
+                    root_offset = tonic_offset + min(dest_jins.pitches)
+                    if root_offset > 0:
+                        rows.append((dest_ix, tonic_offset, root_offset, source_modulation))
+        width = max([len(self.ajnas[name].pitches) for name in dest_names] + [0]) + len(source_jins.extension_pitches)
+        dest_pitches = numpy.full((len(rows), width), numpy.nan)
+        for row, (dest_ix, _, root_offset, _) in enumerate(rows):
+            pitches = self.ajnas[dest_names[dest_ix]].pitches + source_jins.extension_pitches
+            dest_pitches[row, : len(pitches)] = root_offset + numpy.array(pitches)
+        source_pitches = source_jins.pitches + source_jins.extension_pitches
+        similarities = similarity_scores(source_pitches, dest_pitches)
+
+        for dest_name in dest_names:
+            self._best[(source_name, dest_name)] = None
+        best_similarities = dict()
+        for (dest_ix, tonic_offset, root_offset, source_modulation), similarity in zip(rows, similarities.tolist()):
+            if similarity > best_similarities.get(dest_ix, 0):
+                best_similarities[dest_ix] = similarity
+                self._best[(source_name, dest_names[dest_ix])] = Modulation(
+                    tonic_offset, root_offset, source_jins.pitches.index(source_modulation), similarity
+                )
+
+
+def _modulation_row(modulations: ModulationCache, source_name: str) -> numpy.ndarray:
+    """The `ModulationTable.columns` from the source to every jins, (5, n)."""
+    modulations._compute(source_name, list(modulations.ajnas))
+    row = numpy.zeros((len(ModulationTable.columns), len(modulations.ajnas)))
+    for ix, dest_name in enumerate(modulations.ajnas):
+        if (modulation := modulations.best(source_name, dest_name)) is not None:
+            row[:, ix] = ModulationTable.values(modulation)
+    return row
+
+
+def _table_row(source_name: str) -> numpy.ndarray:
+    return _modulation_row(_worker_modulations, source_name)
+
+
+class ModulationTable:
+    version = 2
+    columns = Modulation._fields + ("integer_offsets",)
+    TONIC_OFFSET_INTEGER = 1
+    ROOT_OFFSET_INTEGER = 2
+
+    def __init__(
+        self,
+        ajnas: Dict[str, maqamator.Jins],
+        *,
+        tonic_offset: numpy.ndarray,
+        root_offset: numpy.ndarray,
+        modulation_index: numpy.ndarray,
+        similarity: numpy.ndarray,
+        integer_offsets: numpy.ndarray,
+    ):
+        """The best modulation between every pair of ajnas in a catalog, as (source, dest) arrays in catalog order.
+
+        Answers `best` and `candidates` like a `ModulationCache`, so `Sayr`, `best_paths` and `build_sayrs` can read
+        from it instead of computing the modulations again.
+
+        Args:
+            ajnas (Dict[str, maqamator.Jins]): The catalog.
+            tonic_offset (numpy.ndarray):      The fields of `Modulation`, (n, n) each. A similarity of 0 means there is
+            root_offset (numpy.ndarray):       no modulation.
+            modulation_index (numpy.ndarray):
+            similarity (numpy.ndarray):
+            integer_offsets (numpy.ndarray):   The TONIC_OFFSET_INTEGER and ROOT_OFFSET_INTEGER bits are set where the
+                                               offsets are ints in the `ModulationCache`, (n, n).
+        """
+        self.ajnas = ajnas
+        self.names = list(ajnas)
+        self._ids = {name: ix for ix, name in enumerate(self.names)}
+        self.tonic_offset = tonic_offset
+        self.root_offset = root_offset
+        self.modulation_index = modulation_index.astype(int)
+        self.similarity = similarity.astype(int)
+        self.integer_offsets = integer_offsets.astype(int)
+        self._candidates: Dict[str, List[Tuple[str, Modulation]]] = dict()
+        self._bounds: Optional[ModulationBounds] = None
+
+    @classmethod
+    def compute(cls, ajnas: Dict[str, maqamator.Jins], *, processes: Optional[int] = None) -> "ModulationTable":
+        """Compute the table a row (source jins) at a time, in a process pool unless processes is 1.
+
+        Each row scores every destination in one batch, see `ModulationCache`.
+        """
+        if processes == 1:
+            modulations = ModulationCache(ajnas)
+            rows = [_modulation_row(modulations, name) for name in ajnas]
+        else:
+            with multiprocessing.Pool(processes, initializer=_init_build_worker, initargs=(ajnas,)) as pool:
+                rows = pool.map(_table_row, list(ajnas))
+        columns = numpy.stack(rows, axis=1).reshape(len(cls.columns), len(ajnas), -1)
+        return cls(ajnas, **dict(zip(cls.columns, columns)))
+
+    @classmethod
+    def values(cls, modulation: Modulation) -> Tuple:
+        """The columns of a modulation, the types of its offsets as integer_offsets bits."""
+        return (
+            *modulation,
+            cls.TONIC_OFFSET_INTEGER * isinstance(modulation.tonic_offset, int)
+            | cls.ROOT_OFFSET_INTEGER * isinstance(modulation.root_offset, int),
+        )
+
+    @classmethod
+    def key(cls, ajnas: Dict[str, maqamator.Jins]) -> str:
+        """A hash of everything the modulations depend on: the names, pitches and modulation points, in order."""
+        content = [
+            [name, [float(pitch) for pitch in pitches]]
+            for name, jins in ajnas.items()
+            for pitches in (jins.pitches, jins.extension_pitches, jins.modulation_pitches)
+        ]
+        return hashlib.sha256(json.dumps([cls.version, content]).encode()).hexdigest()
+
+    @classmethod
+    def load(
+        cls, ajnas: Dict[str, maqamator.Jins], directory: pathlib.Path, *, processes: Optional[int] = None
+    ) -> "ModulationTable":
+        """The table for the catalog, computed only if it is not cached in the directory yet.
+
+        If the directory can not be written, e.g. in a read-only install, the table is computed each time.
+        """
+        directory = pathlib.Path(directory)
+        entry = directory / f"modulations_{cls.key(ajnas)}.npz"
+        if entry.is_file():
+            with contextlib.suppress(OSError, ValueError, KeyError):
+                with numpy.load(entry) as data:
+                    return cls(ajnas, **{column: data[column] for column in cls.columns})
+        table = cls.compute(ajnas, processes=processes)
+        write_atomically(entry, lambda f: numpy.savez(f, **{column: getattr(table, column) for column in cls.columns}))
+        return table
+
+    def with_jins(self, ajnas: Dict[str, maqamator.Jins], name: str) -> "ModulationTable":
+        """A table for a catalog where only the named jins was added, changed or removed.
+
+        The modulations between the other ajnas are copied, only the row and column of the named jins are computed.
+        """
+        kept = [ix for ix, key in enumerate(ajnas) if key != name and key in self._ids]
+        old = [self._ids[key] for key in ajnas if key != name and key in self._ids]
+        columns = dict()
+        for column in self.columns:
+            values = numpy.zeros((len(ajnas), len(ajnas)))
+            values[numpy.ix_(kept, kept)] = getattr(self, column)[numpy.ix_(old, old)]
+            columns[column] = values
+        if name in ajnas:
+            ix = list(ajnas).index(name)
+            modulations = ModulationCache(ajnas)
+            row = _modulation_row(modulations, name)
+            for source_ix, source_name in enumerate(ajnas):
+                if source_name != name and (modulation := modulations.best(source_name, name)) is not None:
+                    for column, value in zip(self.columns, self.values(modulation)):
+                        columns[column][source_ix, ix] = value
+            for column, values in zip(self.columns, row):
+                columns[column][ix] = values
+        return ModulationTable(ajnas, **columns)
+
+    def best(self, source_name: str, dest_name: str) -> Optional[Modulation]:
+        """The best modulation from source to dest, None if there is none that rises and shares pitches."""
+        source, dest = self._ids[source_name], self._ids[dest_name]
+        if self.similarity[source, dest] <= 0:
+            return None
+        tonic_offset, root_offset = self.tonic_offset[source, dest].item(), self.root_offset[source, dest].item()
+        integer_offsets = self.integer_offsets[source, dest].item()
+        return Modulation(
+            int(tonic_offset) if integer_offsets & self.TONIC_OFFSET_INTEGER else tonic_offset,
+            int(root_offset) if integer_offsets & self.ROOT_OFFSET_INTEGER else root_offset,
+            self.modulation_index[source, dest].item(),
+            self.similarity[source, dest].item(),
+        )
+
+    def candidates(self, source_name: str) -> List[Tuple[str, Modulation]]:
+        """(dest name, modulation) for every other jins that can be modulated to, most similar first."""
+        if source_name not in self._candidates:
+            source = self._ids[source_name]
+            self._candidates[source_name] = [
+                (self.names[dest], self.best(source_name, self.names[dest]))
+                for dest in numpy.argsort(-self.similarity[source], kind="stable").tolist()
+                if dest != source and self.similarity[source, dest] > 0
+            ]
+        return self._candidates[source_name]
+
+    def bounds(self) -> ModulationBounds:
+        """The bounds of the whole catalog, read from the arrays."""
+        if self._bounds is None:
+            exists = (self.similarity > 0) & ~numpy.eye(len(self.names), dtype=bool)
+            predecessors = collections.defaultdict(list)
+            for source, dest in zip(*numpy.nonzero(exists)):
+                predecessors[self.names[dest]].append(self.names[source])
+            self._bounds = ModulationBounds(
+                dict(predecessors),
+                self.similarity[exists].max(initial=0).item(),
+                self.root_offset[exists].max(initial=0).item(),
+            )
+        return self._bounds
+
+
+Modulations = Union[ModulationCache, ModulationTable]
+
+
+class Location(NamedTuple):
+    """Where a jins sits in a sayr, as in the nodes of `Sayr.graph`."""
+
+    name: str
+    root_pitch: float
+    tonic_pitch: float
+    degree: int
+
+
+class SayrPath(NamedTuple):
+    cost: float
+    locations: Tuple[Location, ...]  # from the source to the target
+    similarities: Tuple[float, ...]  # of each modulation along the way
+
+
+def modulation_cost(similarity: float) -> float:
+    """The cost of a modulation, the more pitches the ajnas share the cheaper."""
+    return 1.0 / similarity
+
+
+def best_paths(
+    modulations: Modulations,
+    source: str,
+    target: str,
+    k: int = 1,
+    *,
+    source_pitch: float = 0,
+    source_degree: int = 1,
+    target_tonic_pitch: Optional[float] = None,
+    max_depth: int = 4,
+) -> List[SayrPath]:
+    """The k cheapest ways to modulate from a source jins to a target jins, found by A* search without building a sayr.
+
+    Locations are only generated as the search reaches them. The heuristic is the cheapest possible modulation times
+    a lower bound on the number of modulations still needed: the fewest hops between the ajnas and, if the target
+    tonic pitch is given, how far the root still has to rise (roots rise with every modulation). Both bounds drop by
+    at most one per modulation, so the heuristic is admissible and consistent and the paths come out cheapest first.
+
+    The bounds are computed once per modulations object and kept on it (see `ModulationBounds`). For a
+    `ModulationCache` that means every modulation of the catalog on the first search, so pass a `ModulationTable`
+    when searching a large catalog only once.
+
+    Args:
+        modulations (Modulations):            The catalog and the modulations within it.
+        source (str):                         Name of the jins to start from.
+        target (str):                         Name of the jins to end at.
+        k (int):                              Number of paths.
+        source_pitch (float):                 Tonic pitch of the source jins [semitones].
+        source_degree (int):                  Degree of the source jins.
+        target_tonic_pitch (Optional[float]): Tonic pitch the target jins must have, anywhere if None.
+        max_depth (int):                      Most modulations in a path.
+
+    Returns:
+        List[SayrPath]: Up to k paths, cheapest first.
+    """
+    ajnas = modulations.ajnas
+    bounds = modulations.bounds()
+    hops = bounds.hops(target)
+    if source not in hops:
+        return []
+    max_root_offset = bounds.max_root_offset
+    target_root_pitch = None if target_tonic_pitch is None else target_tonic_pitch + min(ajnas[target].pitches)
+
+    def is_target(location: Location) -> bool:
+        return location.name == target and (
+            target_tonic_pitch is None or math.isclose(location.tonic_pitch, target_tonic_pitch)
+        )
+
+    start = Location(source, source_pitch + min(ajnas[source].pitches), source_pitch, source_degree)
+    if bounds.max_similarity <= 0:  # no modulations in the catalog, only the source itself can be the target
+        return [SayrPath(0.0, (start,), ())][:k] if is_target(start) else []
+    cheapest = modulation_cost(bounds.max_similarity)
+
+    def heuristic(location: Location, depth: int) -> Optional[float]:
+        """Lower bound on the remaining cost, None if the target cannot be reached from here."""
+        if is_target(location):
+            return 0.0
+        if location.name not in hops:
+            return None
+        remaining = max(hops[location.name], 1)
+        if target_root_pitch is not None:
+            rise = target_root_pitch - location.root_pitch
+            if rise <= 0 or max_root_offset <= 0:
+                return None
+            remaining = max(remaining, math.ceil(rise / max_root_offset))
+        return None if depth + remaining > max_depth else remaining * cheapest
+
+    if (estimate := heuristic(start, 0)) is None:
+        return []
+    tiebreak = 0  # never compare the paths themselves
+    frontier = [(estimate, 0.0, tiebreak, (start,), ())]
+    expansions = collections.Counter()
+    paths = []
+    while frontier and len(paths) < k:
+        _, cost, _, locations, similarities = heapq.heappop(frontier)
+        location = locations[-1]
+        if is_target(location):
+            paths.append(SayrPath(cost, locations, similarities))
+            continue
+        # the k cheapest paths through a location only ever continue its k cheapest paths to it (at that depth, as
+        # the depth limits where they can go next)
+        expansions[location, len(locations)] += 1
+        if expansions[location, len(locations)] > k:
+            continue
+        for dest_name, modulation in modulations.candidates(location.name):
+            dest = Location(
+                dest_name,
+                location.root_pitch + modulation.root_offset,
+                location.root_pitch + modulation.tonic_offset,
+                location.degree + modulation.modulation_index,
+            )
+            if (estimate := heuristic(dest, len(locations))) is not None:
+                dest_cost = cost + modulation_cost(modulation.similarity)
+                tiebreak += 1
+                heapq.heappush(
+                    frontier,
+                    (
+                        dest_cost + estimate,
+                        dest_cost,
+                        tiebreak,
+                        locations + (dest,),
+                        similarities + (modulation.similarity,),
+                    ),
+                )
+    return paths
+
+
+class CompactGraph:
+    version = 2
+    columns = (
+        "name",
+        "root_pitch",
+        "tonic_pitch",
+        "integer_pitches",
+        "degree",
+        "similarity",
+        "depth",
+        "indptr",
+        "indices",
+    )
+    ROOT_PITCH_INTEGER = 1
+    TONIC_PITCH_INTEGER = 2
+    BOTTOM_SIMILARITY = -1  # the similarity of the bottom jins is infinite
+
+    def __init__(
+        self,
+        *,
+        names: List[str],
+        name: numpy.ndarray,
+        root_pitch: numpy.ndarray,
+        tonic_pitch: numpy.ndarray,
+        integer_pitches: numpy.ndarray,
+        degree: numpy.ndarray,
+        similarity: numpy.ndarray,
+        depth: numpy.ndarray,
+        indptr: numpy.ndarray,
+        indices: numpy.ndarray,
+        metadata: Optional[Dict[str, Any]] = None,
+    ):
+        """A sayr graph as columns: node i is jins names[name[i]] at root_pitch[i] and so on, and its successors are
+        indices[indptr[i]:indptr[i + 1]] (compressed sparse rows).
+
+        Args:
+            names (List[str]):          Jins names, indexed by the name column.
+            name (numpy.ndarray):       Index into names, (n,).
+            root_pitch (numpy.ndarray): Node attributes as in `Sayr.add_node`, (n,) each. The pitches are floats, with
+                                        the ROOT_PITCH_INTEGER and TONIC_PITCH_INTEGER bits of integer_pitches set
+                                        where they were ints, and the similarity is BOTTOM_SIMILARITY where it was
+                                        infinite.
+            indptr (numpy.ndarray):     Where the successors of each node start in indices, (n + 1,).
+            indices (numpy.ndarray):    Successor node ids, (edges,).
+            metadata (Dict[str, Any]):  Anything json-friendly to keep with the graph.
+        """
+        self.names = names
+        self.name = name
+        self.root_pitch = root_pitch
+        self.tonic_pitch = tonic_pitch
+        self.integer_pitches = integer_pitches
+        self.degree = degree
+        self.similarity = similarity
+        self.depth = depth
+        self.indptr = indptr
+        self.indices = indices
+        self.metadata = dict() if metadata is None else metadata
+
+    def __len__(self):
+        return len(self.name)
+
+    @classmethod
+    def from_graph(cls, graph: networkx.DiGraph, metadata: Optional[Dict[str, Any]] = None) -> "CompactGraph":
+        ids = {node: ix for ix, node in enumerate(graph)}
+        names = sorted({data["name"] for _, data in graph.nodes(data=True)})
+        name_ids = {name: ix for ix, name in enumerate(names)}
+        nodes = graph.nodes
+        successors = [[ids[dest] for dest in graph.successors(node)] for node in graph]
+        return cls(
+            names=names,
+            name=numpy.array([name_ids[nodes[node]["name"]] for node in graph], dtype=numpy.int32),
+            root_pitch=numpy.array([nodes[node]["root_pitch"] for node in graph], dtype=float),
+            tonic_pitch=numpy.array([nodes[node]["tonic_pitch"] for node in graph], dtype=float),
+            integer_pitches=numpy.array(
+                [
+                    cls.ROOT_PITCH_INTEGER * isinstance(nodes[node]["root_pitch"], int)
+                    | cls.TONIC_PITCH_INTEGER * isinstance(nodes[node]["tonic_pitch"], int)
+                    for node in graph
+                ],
+                dtype=numpy.uint8,
+            ),
+            degree=numpy.array([nodes[node]["degree"] for node in graph], dtype=numpy.int32),
+            similarity=numpy.array(
+                [
+                    cls.BOTTOM_SIMILARITY if math.isinf(nodes[node]["similarity"]) else nodes[node]["similarity"]
+                    for node in graph
+                ],
+                dtype=numpy.int64,
+            ),
+            depth=numpy.array([nodes[node]["depth"] for node in graph], dtype=numpy.int32),
+            indptr=numpy.cumsum([0] + [len(dests) for dests in successors], dtype=numpy.int64),
+            indices=numpy.array([dest for dests in successors for dest in dests], dtype=numpy.int32),
+            metadata=metadata,
+        )
+
+    def identity(self, node: int) -> str:
+        """The id of the node in `Sayr.graph`."""
+        return Sayr._identity(
+            name=self.names[self.name[node]],
+            root_pitch=self.root_pitch[node],
+            tonic_pitch=self.tonic_pitch[node],
+            degree=int(self.degree[node]),
+        )
+
+    def successors(self, node: int) -> numpy.ndarray:
+        return self.indices[self.indptr[node] : self.indptr[node + 1]]
+
+    def to_graph(self, ajnas: Dict[str, maqamator.Jins]) -> networkx.DiGraph:
+        graph = networkx.DiGraph()
+        identities = [self.identity(node) for node in range(len(self))]
+        for node, identity in enumerate(identities):
+            name = self.names[self.name[node]]
+            integer_pitches = int(self.integer_pitches[node])
+            root_pitch, tonic_pitch = self.root_pitch[node].item(), self.tonic_pitch[node].item()
+            similarity = self.similarity[node].item()
+            graph.add_node(
+                identity,
+                name=name,
+                root_pitch=int(root_pitch) if integer_pitches & self.ROOT_PITCH_INTEGER else root_pitch,
+                tonic_pitch=int(tonic_pitch) if integer_pitches & self.TONIC_PITCH_INTEGER else tonic_pitch,
+                jins=ajnas[name],
+                degree=self.degree[node].item(),
+                similarity=float("inf") if similarity == self.BOTTOM_SIMILARITY else similarity,
+                depth=self.depth[node].item(),
+            )
+        for node, identity in enumerate(identities):
+            graph.add_edges_from((identity, identities[dest]) for dest in self.successors(node).tolist())
+        return graph
+
+    def save(self, directory: pathlib.Path):
+        """One .npy file per column and the names and metadata in graph.json."""
+        directory = pathlib.Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for column in self.columns:
+            numpy.save(directory / f"{column}.npy", getattr(self, column))
+        with open(directory / "graph.json", "w", encoding="utf-8") as f:
+            json.dump({"version": self.version, "names": self.names, "metadata": self.metadata}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory: pathlib.Path, *, mmap: bool = False) -> "CompactGraph":
+        """Load a saved graph, memory mapping the columns read-only instead of reading them if mmap."""
+        directory = pathlib.Path(directory)
+        with open(directory / "graph.json", encoding="utf-8") as f:
+            header = json.load(f)
+        if header["version"] != cls.version:
+            raise ValueError(f"{directory} is version {header['version']}, expected {cls.version}")
+        columns = {
+            column: numpy.load(directory / f"{column}.npy", mmap_mode="r" if mmap else None) for column in cls.columns
+        }
+        return cls(names=header["names"], metadata=header["metadata"], **columns)
 
 
 class Sayr:
@@ -24,15 +656,26 @@ class Sayr:
         bottom_degree: int,
         depth: int,
         topk: List[int] = None,
+        modulations: Optional[Modulations] = None,
     ):
         self.ajnas = ajnas
+        self.modulations = ModulationCache(ajnas) if modulations is None else modulations
         self.bottom = bottom
         self.bottom_tonic_pitch = bottom_pitch
         self.bottom_degree = bottom_degree
         self.depth = depth
-        self.graph = networkx.DiGraph()
         self.topk = topk
-        self._create_graph()
+        self._graph: Optional[networkx.DiGraph] = None
+        self._edges: Optional[set] = None  # in the graph as last searched, None if not known
+        self._expansions: Dict[Tuple, List[Tuple[str, Dict[str, Any], float]]] = dict()
+
+    @property
+    def graph(self) -> networkx.DiGraph:
+        """The sayr graph, built on first access."""
+        if self._graph is None:
+            self._graph = networkx.DiGraph()
+            self._create_graph()
+        return self._graph
 
     def add_node(
         self,
@@ -45,8 +688,7 @@ class Sayr:
         similarity: float,
         depth: int,
     ):
-
-        identity = f"{name} {degree} : {int(root_pitch)}/{int(tonic_pitch)}"
+        identity = self._identity(name=name, root_pitch=root_pitch, tonic_pitch=tonic_pitch, degree=degree)
         self.graph.add_node(
             identity,
             name=name,
@@ -59,103 +701,184 @@ class Sayr:
         )
         return identity
 
+    @staticmethod
+    def _identity(*, name: str, root_pitch: float, tonic_pitch: float, degree: int):
+        return f"{name} {degree} : {int(root_pitch)}/{int(tonic_pitch)}"
+
     def _create_graph(self):
-        identity = self.add_node(
-            name=self.bottom,
-            root_pitch=self.bottom_tonic_pitch + min(self.ajnas[self.bottom].pitches),
-            tonic_pitch=self.bottom_tonic_pitch,
-            jins=self.ajnas[self.bottom],
-            degree=self.bottom_degree,
-            similarity=float("inf"),
-            depth=0,
-        )
-        self._expand_graph(identity, 1)
-        # nodes_to_remove = [
-        #     node for node, in_deg in self.graph.in_degree() if in_deg <= 1 and self.graph.nodes[node]["depth"] > 1
-        # ]
-        # self.graph.remove_nodes_from(nodes_to_remove)
-        nodes_to_remove = [
-            node
-            for node, out_deg in self.graph.out_degree()
-            if out_deg <= 0 and self.graph.nodes[node]["depth"] < self.depth
-        ]
-        self.graph.remove_nodes_from(nodes_to_remove)
-
-    def _similarity_score(self, source_pitches, dest_pitches, threshold=0.25):
-        used_indices = []  # To keep track of used elements in dest_pitches
-
-        # Iterate through each pitch in source_pitches
-        for pitch in source_pitches:
-            closest_distance = None
-            closest_index = None
-
-            for i, dest_pitch in enumerate(dest_pitches):
-                if i not in used_indices:  # Avoid double counting
-                    # Try some module octave stuff
-                    distance = abs((pitch % 12.0) - (dest_pitch % 12.0))
-                    if distance < threshold:
-                        if (closest_distance is None) or (distance < closest_distance):
-                            closest_distance = distance
-                            closest_index = i
-
-            if closest_index is not None:
-                used_indices.append(closest_index)
-
-        return len(used_indices)
-
-    def _expand_graph(self, source_id, current_depth):
-        if current_depth > self.depth:
-            return
-
-        source_name: str = self.graph.nodes[source_id]["name"]
-        source_root_pitch: int = self.graph.nodes[source_id]["root_pitch"]
-        source_jins: maqamator.Jins = self.graph.nodes[source_id]["jins"]
-        source_degree: int = self.graph.nodes[source_id]["degree"]
-        bestkwargslist = []
-        for dest_name, dest_jins in self.ajnas.items():
-            if source_name == dest_name:
+        self._apply(*self._search())
+
+    @staticmethod
+    def _similarity_score(source_pitches, dest_pitches, threshold=0.25):
+        return similarity_score(source_pitches, dest_pitches, threshold)
+
+    def _search(self) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, List[str]]]:
+        """Breadth first search from the bottom jins: node attributes and successors by node id, before pruning.
+
+        Nodes are expanded once, in the order they are found, unless they are found at the full depth. A node that is
+        found again is linked but keeps the attributes it was first found with.
+        """
+        bottom = {
+            "name": self.bottom,
+            "root_pitch": self.bottom_tonic_pitch + min(self.ajnas[self.bottom].pitches),
+            "tonic_pitch": self.bottom_tonic_pitch,
+            "degree": self.bottom_degree,
+        }
+        nodes = {self._identity(**bottom): dict(bottom, jins=self.ajnas[self.bottom], similarity=float("inf"), depth=0)}
+        successors = dict()
+        order = list(nodes)
+        for source_id in order:  # grows as nodes are found
+            source = nodes[source_id]
+            if source["depth"] >= self.depth:
                 continue
-            best_root_pitch = None
-            best_tonic_pitch = None
-            best_modulation = None
-            best_similarity = 0
-            for source_modulation in source_jins.modulation_pitches:
-                for dest_modulation in dest_jins.modulation_pitches:
-                    dest_tonic_pitch = source_root_pitch + source_modulation - dest_modulation
-                    dest_root_pitch = dest_tonic_pitch + min(dest_jins.pitches)
-                    if dest_root_pitch > source_root_pitch:
-                        source_pitches = source_root_pitch + numpy.array(
-                            source_jins.pitches + source_jins.extension_pitches
-                        )
-                        dest_pitches = dest_root_pitch + numpy.array(dest_jins.pitches + source_jins.extension_pitches)
-                        similarity = self._similarity_score(source_pitches=source_pitches, dest_pitches=dest_pitches)
-                        if similarity > best_similarity:
-                            best_similarity = similarity
-                            best_tonic_pitch = dest_tonic_pitch
-                            best_root_pitch = dest_root_pitch
-                            best_modulation = source_modulation
-            if best_root_pitch is not None and best_tonic_pitch is not None and best_modulation is not None:
-                bestkwargslist.append(
-                    {
-                        "name": dest_name,
-                        "root_pitch": best_root_pitch,
-                        "tonic_pitch": best_tonic_pitch,
-                        "jins": dest_jins,
-                        "degree": source_degree + source_jins.pitches.index(best_modulation),
-                        "similarity": best_similarity,
-                        "depth": current_depth,
-                    }
-                )
-        bestkwargslist = sorted(bestkwargslist, key=lambda x: x["similarity"], reverse=True)
-        for ix, bestkwargs in enumerate(bestkwargslist):
-            if self.topk is None or ix < 1 + self.topk[current_depth]:
-                dest_id = self.add_node(**bestkwargs)
-                self.graph.add_edge(source_id, dest_id)
-                self._expand_graph(dest_id, current_depth=current_depth + 1)
-            else:
-                pass
+            successors[source_id] = []
+            for dest_id, location, similarity in self._expand(source):
+                if dest_id not in nodes:
+                    nodes[dest_id] = dict(
+                        location, jins=self.ajnas[location["name"]], similarity=similarity, depth=source["depth"] + 1
+                    )
+                    order.append(dest_id)
+                successors[source_id].append(dest_id)
+        return nodes, successors
+
+    def _expand(self, source: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any], float]]:
+        """(dest id, location, similarity) of the modulations from a node, kept for the next search.
+
+        They only depend on the jins, where it is and the depth, not on the rest of the graph.
+        """
+        key = (source["name"], source["root_pitch"], source["degree"], source["depth"])
+        if key not in self._expansions:
+            dests = []
+            for ix, (dest_name, modulation) in enumerate(self.modulations.candidates(source["name"])):
+                if self.topk is not None and ix >= 1 + self.topk[source["depth"] + 1]:
+                    break
+                location = {
+                    "name": dest_name,
+                    "root_pitch": source["root_pitch"] + modulation.root_offset,
+                    "tonic_pitch": source["root_pitch"] + modulation.tonic_offset,
+                    "degree": source["degree"] + modulation.modulation_index,
+                }
+                dests.append((self._identity(**location), location, modulation.similarity))
+            self._expansions[key] = dests
+        return self._expansions[key]
+
+    def _apply(self, nodes: Dict[str, Dict[str, Any]], successors: Dict[str, List[str]]):
+        """Bring the graph in line with a search, touching only the nodes and edges that differ.
+
+        Nodes above the full depth that lead nowhere are pruned.
+        """
+        kept = {node: attrs for node, attrs in nodes.items() if successors.get(node) or attrs["depth"] >= self.depth}
+        self.graph.remove_nodes_from([node for node in self.graph if node not in kept])
+        for node, attrs in kept.items():
+            if node not in self.graph:
+                self.add_node(**attrs)
+            elif self.graph.nodes[node] != attrs:
+                self.graph.nodes[node].update(attrs)
+        edges = [(source, dest) for source in kept for dest in successors.get(source, ()) if dest in kept]
+        old_edges = set(self.graph.edges) if self._edges is None else self._edges
+        self._edges = set(edges)
+        self.graph.remove_edges_from(old_edges - self._edges)
+        self.graph.add_edges_from(edge for edge in edges if edge not in old_edges)
 
-    def visualize(self, filename="sayr_graph.png"):
+    def add_jins(self, name: str, jins: maqamator.Jins):
+        """Add a jins to the catalog of this sayr and update the graph, see `update_jins`."""
+        if name in self.ajnas:
+            raise ValueError(f"{name} is already in the catalog")
+        self._change_jins(name, {**self.ajnas, name: jins})
+
+    def update_jins(self, name: str, jins: maqamator.Jins):
+        """Replace a jins in the catalog of this sayr and update the graph.
+
+        Only the modulations to and from the jins are computed again, and only the nodes whose modulations changed
+        are expanded again. The search is then replayed from what is kept, and the graph is changed where it
+        differs, which gives the same graph as building the sayr again. The catalog is copied, not changed.
+        """
+        if name not in self.ajnas:
+            raise KeyError(name)
+        self._change_jins(name, {key: jins if key == name else value for key, value in self.ajnas.items()})
+
+    def remove_jins(self, name: str):
+        """Remove a jins from the catalog of this sayr and update the graph, see `update_jins`."""
+        if name == self.bottom:
+            raise ValueError(f"Can not remove the bottom jins {name}")
+        if name not in self.ajnas:
+            raise KeyError(name)
+        self._change_jins(name, {key: value for key, value in self.ajnas.items() if key != name})
+
+    def _change_jins(self, name: str, ajnas: Dict[str, maqamator.Jins]):
+        modulations = self.modulations.with_jins(ajnas, name)
+        if self._graph is not None:
+            changed = {name}
+            # every cached expansion, also of ajnas that left the graph, since they are reused if they come back
+            for source_name in {key[0] for key in self._expansions} - changed:
+                if self.modulations.candidates(source_name) != modulations.candidates(source_name):
+                    changed.add(source_name)
+            self._expansions = {key: dests for key, dests in self._expansions.items() if key[0] not in changed}
+        self.ajnas = ajnas
+        self.modulations = modulations
+        if self._graph is not None:
+            self._apply(*self._search())
+
+    def compact(self) -> CompactGraph:
+        return CompactGraph.from_graph(
+            self.graph,
+            metadata={
+                "bottom": self.bottom,
+                "bottom_pitch": self.bottom_tonic_pitch,
+                "bottom_degree": self.bottom_degree,
+                "depth": self.depth,
+                "topk": self.topk,
+            },
+        )
+
+    def save(self, directory: pathlib.Path):
+        """Save the graph in the compact format, see `CompactGraph.save`."""
+        self.compact().save(directory)
+
+    @classmethod
+    def load(
+        cls,
+        directory: pathlib.Path,
+        ajnas: Dict[str, maqamator.Jins],
+        *,
+        mmap: bool = False,
+        modulations: Optional[Modulations] = None,
+    ) -> "Sayr":
+        """Load a saved sayr without building its graph again.
+
+        Args:
+            directory (pathlib.Path):                The directory it was saved to.
+            ajnas (Dict[str, maqamator.Jins]):       The catalog it was built from.
+            mmap (bool):                             Memory map the columns, see `CompactGraph.load`.
+            modulations (Optional[Modulations]):     Shared modulations, as for `Sayr`.
+        """
+        compact = CompactGraph.load(directory, mmap=mmap)
+        sayr = cls(ajnas, modulations=modulations, **compact.metadata)
+        sayr._graph = compact.to_graph(ajnas)
+        return sayr
+
+    def best_paths(self, target: str, k: int = 1, *, target_tonic_pitch: Optional[float] = None) -> List[SayrPath]:
+        """The k cheapest paths from the bottom jins to the target within the depth, see `best_paths`.
+
+        Only the modulations are shared with the graph, which is neither built nor pruned with topk for this.
+        """
+        return best_paths(
+            self.modulations,
+            self.bottom,
+            target,
+            k,
+            source_pitch=self.bottom_tonic_pitch,
+            source_degree=self.bottom_degree,
+            target_tonic_pitch=target_tonic_pitch,
+            max_depth=self.depth,
+        )
+
+    def visualize(self, filename="sayr_graph.png", *, engine: str = "dot"):
+        """Draw the graph with graphviz dot, or with the built-in `sayr_diagram` (much faster, also to .svg)."""
+        if engine == "builtin":
+            return sayr_diagram.SayrDiagram(self.graph).save(filename)
+        if engine != "dot":
+            raise ValueError(f"Unknown engine {engine}")
         A = networkx.nx_agraph.to_agraph(self.graph)
         A.graph_attr["rankdir"] = "LR"
         A.node_attr["shape"] = "rect"
@@ -189,33 +912,149 @@ class Sayr:
         return filename
 
 
-# My best effort to reproduce maqam zanjaran sayr
-zanjaran = Sayr(
-    {
-        key: value
-        for key, value in maqamator.arabic_ajnas.items()
-        if key in {"Ajam3", "Ajam5", "Hijaz", "SabaDalanshin", "Nahawand", "Nikriz", "Hijazkar"}
-    },
-    bottom="Hijaz",
-    bottom_pitch=0,
-    bottom_degree=1,
-    depth=2,
-)
-zanjaran.visualize("zanjaran.png")
-
-iraq = Sayr(
-    {
-        key: value
-        for key, value in maqamator.arabic_ajnas.items()
-        if key in {"Rast", "Sikah", "Bayati", "Hijaz", "Saba", "Nahawand"}
-    },
-    bottom="Sikah",
-    bottom_pitch=0,
-    bottom_degree=1,
-    depth=2,
-)
-iraq.visualize("iraq.png")
-
-for source in maqamator.arabic_ajnas.keys():
-    from_source = Sayr(maqamator.arabic_ajnas, bottom=source, bottom_pitch=0, bottom_degree=1, depth=1, topk=[1, 5])
-    from_source.visualize(f"from_{source}.png")
+_worker_modulations: Optional[Modulations] = None
+
+
+def _init_build_worker(ajnas: Dict[str, maqamator.Jins], table: Optional[ModulationTable] = None):
+    # one set of modulations per worker, shared by all the sayrs it builds
+    global _worker_modulations
+    _worker_modulations = ModulationCache(ajnas) if table is None else table
+
+
+def _build(bottom: str, sayr_kwargs: Dict) -> Tuple[str, Sayr]:
+    sayr = Sayr(_worker_modulations.ajnas, bottom=bottom, modulations=_worker_modulations, **sayr_kwargs)
+    sayr.graph  # build it here rather than wherever it ends up
+    return bottom, sayr
+
+
+def _render(sayr: Sayr, filename: str, engine: str = "dot") -> str:
+    return sayr.visualize(filename, engine=engine)
+
+
+def build_sayrs(
+    ajnas: Dict[str, maqamator.Jins],
+    bottoms: Iterable[str],
+    *,
+    processes: Optional[int] = None,
+    table: Optional[ModulationTable] = None,
+    **sayr_kwargs,
+) -> Iterator[Tuple[str, Sayr]]:
+    """Build a sayr from each bottom jins in a process pool, yielding (bottom, sayr) as each one is done.
+
+    Args:
+        ajnas (Dict[str, maqamator.Jins]): The catalog to modulate within.
+        bottoms (Iterable[str]):           Names of the bottom ajnas.
+        processes (Optional[int]):         Number of worker processes, all cores if None.
+        table (Optional[ModulationTable]): The modulations of the catalog, computed first if None.
+        sayr_kwargs:                       bottom_pitch, bottom_degree, depth and topk, see `Sayr`.
+    """
+    sayr_kwargs = {"bottom_pitch": 0, "bottom_degree": 1, **sayr_kwargs}
+    table = ModulationTable.compute(ajnas, processes=processes) if table is None else table
+    with multiprocessing.Pool(processes, initializer=_init_build_worker, initargs=(ajnas, table)) as pool:
+        yield from pool.imap_unordered(functools.partial(_build, sayr_kwargs=sayr_kwargs), bottoms)
+
+
+def build_and_render_sayrs(
+    ajnas: Dict[str, maqamator.Jins],
+    bottoms: Iterable[str],
+    output_root: pathlib.Path,
+    *,
+    processes: Optional[int] = None,
+    render_processes: Optional[int] = None,
+    engine: str = "dot",
+    suffix: str = ".png",
+    **sayr_kwargs,
+) -> Dict[str, pathlib.Path]:
+    """Build sayrs in parallel (see `build_sayrs`) and render each one to from_<bottom><suffix> as soon as it is built.
+
+    The graphviz layout runs in a separate pool, so building and rendering overlap. The built-in engine is fast
+    enough to render in this process as the sayrs come in.
+
+    Returns:
+        Dict[str, pathlib.Path]: The rendered file per bottom jins.
+    """
+    if engine == "builtin":
+        return {
+            bottom: pathlib.Path(_render(sayr, str(output_root / f"from_{bottom}{suffix}"), engine))
+            for bottom, sayr in build_sayrs(ajnas, bottoms, processes=processes, **sayr_kwargs)
+        }
+    with multiprocessing.Pool(render_processes) as render_pool:
+        rendering = dict()
+        for bottom, sayr in build_sayrs(ajnas, bottoms, processes=processes, **sayr_kwargs):
+            filename = str(output_root / f"from_{bottom}{suffix}")
+            rendering[bottom] = render_pool.apply_async(_render, (sayr, filename, engine))
+        return {bottom: pathlib.Path(result.get()) for bottom, result in rendering.items()}
+
+
+def zanjaran() -> Sayr:
+    """My best effort to reproduce maqam zanjaran sayr"""
+    return Sayr(
+        {
+            key: value
+            for key, value in maqamator.arabic_ajnas.items()
+            if key in {"Ajam3", "Ajam5", "Hijaz", "SabaDalanshin", "Nahawand", "Nikriz", "Hijazkar"}
+        },
+        bottom="Hijaz",
+        bottom_pitch=0,
+        bottom_degree=1,
+        depth=2,
+    )
+
+
+def iraq() -> Sayr:
+    return Sayr(
+        {
+            key: value
+            for key, value in maqamator.arabic_ajnas.items()
+            if key in {"Rast", "Sikah", "Bayati", "Hijaz", "Saba", "Nahawand"}
+        },
+        bottom="Sikah",
+        bottom_pitch=0,
+        bottom_degree=1,
+        depth=2,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build and render the sayr from each bottom jins",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("bottoms", nargs="*", help="Names of the bottom ajnas (default: all arabic ajnas)")
+    parser.add_argument("--depth", default=1, type=int, help="Number of modulations from the bottom jins")
+    parser.add_argument("--topk", default=[1, 5], type=int, nargs="*", help="Branches to keep per depth")
+    parser.add_argument("--processes", default=None, type=int, help="Processes building graphs (default: all cores)")
+    parser.add_argument(
+        "--render-processes", default=None, type=int, help="Processes rendering graphs (default: all cores)"
+    )
+    parser.add_argument(
+        "--output-root", default=pathlib.Path().cwd(), type=pathlib.Path, help="Parent folder to the output files"
+    )
+    parser.add_argument(
+        "--cache-dir", default=None, type=pathlib.Path, help="Keep the modulation table of the catalog here"
+    )
+    parser.add_argument("--engine", default="dot", choices=["dot", "builtin"], help="Graph renderer")
+    parser.add_argument("--suffix", default=".png", help="Output format, .svg only with the builtin engine")
+    parser.add_argument("--skip-demos", action="store_true", help="Do not render zanjaran.png and iraq.png")
+    args = parser.parse_args()
+
+    if not args.skip_demos:
+        zanjaran().visualize(str(args.output_root / f"zanjaran{args.suffix}"), engine=args.engine)
+        iraq().visualize(str(args.output_root / f"iraq{args.suffix}"), engine=args.engine)
+
+    table = None
+    if args.cache_dir is not None:
+        table = ModulationTable.load(maqamator.arabic_ajnas, args.cache_dir, processes=args.processes)
+    for bottom, filename in build_and_render_sayrs(
+        maqamator.arabic_ajnas,
+        args.bottoms or list(maqamator.arabic_ajnas),
+        args.output_root,
+        processes=args.processes,
+        render_processes=args.render_processes,
+        engine=args.engine,
+        suffix=args.suffix,
+        table=table,
+        depth=args.depth,
+        topk=args.topk or None,
+    ).items():
+        print(bottom, filename)
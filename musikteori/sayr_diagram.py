@@ -0,0 +1,243 @@
+import argparse
+import html
+import pathlib
+import time
+from typing import Dict, Hashable, Iterable, List, Tuple
+
+import cv2
+import networkx
+import numpy
+
+BLACK = (0, 0, 0)
+WHITE = (255, 255, 255)
+LIGHTGRAY = (211, 211, 211)
+EDGE_COLOR = (96, 96, 96)
+
+
+def layered_layout(graph: networkx.DiGraph, *, sweeps: int = 4) -> Dict[Hashable, Tuple[int, int]]:
+    """Place the nodes of a sayr in layers by tonic pitch, ordered within each layer to cross fewer edges.
+
+    Within a layer the nodes are sorted by the mean position of their neighbours in the other layers (the barycenter
+    heuristic), sweeping back and forth over the layers.
+
+    Args:
+        graph (networkx.DiGraph): Nodes need a tonic_pitch attribute (missing counts as 0).
+        sweeps (int):             Number of ordering passes over the layers.
+
+    Returns:
+        Dict[Hashable, Tuple[int, int]]: (layer, position within the layer) per node.
+    """
+    tonic_pitches = {node: data.get("tonic_pitch", 0) for node, data in graph.nodes(data=True)}
+    layer_of = {tonic_pitch: layer for layer, tonic_pitch in enumerate(sorted(set(tonic_pitches.values())))}
+    layers: List[List[Hashable]] = [[] for _ in layer_of]
+    for node in graph:  # insertion (breadth first) order to start with
+        layers[layer_of[tonic_pitches[node]]].append(node)
+    position = {node: ix for layer in layers for ix, node in enumerate(layer)}
+    neighbours = {
+        node: [
+            other
+            for other in (*graph.predecessors(node), *graph.successors(node))
+            if tonic_pitches[other] != tonic_pitches[node]
+        ]
+        for node in graph
+    }
+    for sweep in range(sweeps):
+        for layer in layers if sweep % 2 == 0 else reversed(layers):
+            barycenter = {
+                node: (
+                    numpy.mean([position[other] for other in neighbours[node]]) if neighbours[node] else position[node]
+                )
+                for node in layer
+            }
+            layer.sort(key=barycenter.__getitem__)
+            position.update((node, ix) for ix, node in enumerate(layer))
+    return {node: (layer_of[tonic_pitches[node]], position[node]) for node in graph}
+
+
+class SayrDiagram:
+    font_face = cv2.FONT_HERSHEY_SIMPLEX
+
+    def __init__(
+        self,
+        graph: networkx.DiGraph,
+        *,
+        font_height: int = 14,
+        padding: int = 8,
+        layer_gap: int = 160,
+        node_gap: int = 16,
+        sweeps: int = 4,
+    ):
+        """Draw a sayr graph without graphviz, left to right by tonic pitch like `Sayr.visualize`.
+
+        Nodes are boxes, the tonic at pitch 0 in black. Edges are labelled with the sum of the degrees of their ends and
+        the similarity of the modulation.
+
+        Args:
+            graph (networkx.DiGraph): A `Sayr.graph`.
+            font_height (int):        Text height [px].
+            padding (int):            Space between a box and its text [px].
+            layer_gap (int):          Space between the layers, where the edges go [px].
+            node_gap (int):           Space between the boxes within a layer [px].
+            sweeps (int):             See `layered_layout`.
+        """
+        self.graph = graph
+        self.font_height = font_height
+        self.font_scale = cv2.getFontScaleFromHeight(self.font_face, font_height, 1)
+        self.label_scale = cv2.getFontScaleFromHeight(self.font_face, max(font_height * 3 // 4, 1), 1)
+        self.labels = {node: str(node) for node in graph}
+        sizes = {node: self._text_size(label, self.font_scale) for node, label in self.labels.items()}
+        placement = layered_layout(graph, sweeps=sweeps)
+        layer_count = max([layer for layer, _ in placement.values()], default=-1) + 1
+        layer_widths = [0] * layer_count
+        for node, (layer, _) in placement.items():
+            layer_widths[layer] = max(layer_widths[layer], sizes[node][0] + 2 * padding)
+        box_height = font_height + 2 * padding
+        lefts = numpy.cumsum([node_gap] + [width + layer_gap for width in layer_widths]).tolist()
+        self.boxes: Dict[Hashable, Tuple[int, int, int, int]] = {
+            node: (lefts[layer], node_gap + position * (box_height + node_gap), layer_widths[layer], box_height)
+            for node, (layer, position) in placement.items()
+        }
+        self.width = int(lefts[-1] - layer_gap + node_gap) if layer_count else 2 * node_gap
+        self.height = max([top + height for _, top, _, height in self.boxes.values()], default=0) + node_gap
+
+    def _text_size(self, text: str, font_scale: float) -> Tuple[int, int]:
+        (width, height), _ = cv2.getTextSize(text, self.font_face, font_scale, 1)
+        return width, height
+
+    def _is_bottom(self, node: Hashable) -> bool:
+        return self.graph.nodes[node].get("tonic_pitch", 0) == 0
+
+    def _edge_label(self, source: Hashable, dest: Hashable) -> str:
+        nodes = self.graph.nodes
+        return f"({nodes[source]['degree'] + nodes[dest]['degree']}) : {nodes[dest]['similarity']}"
+
+    def _edge_points(self, source: Hashable, dest: Hashable) -> numpy.ndarray:
+        """Points along the edge, the middle one in the middle. Edges within a layer curve out to the right and back."""
+        source_left, source_top, source_width, source_height = self.boxes[source]
+        dest_left, dest_top, dest_width, dest_height = self.boxes[dest]
+        source_y, dest_y = source_top + source_height / 2, dest_top + dest_height / 2
+        if dest_left != source_left:
+            forward = dest_left > source_left
+            start = numpy.array([source_left + source_width * forward, source_y])
+            end = numpy.array([dest_left + dest_width * (not forward), dest_y])
+            return numpy.array([start, (start + end) / 2, end])
+        start = numpy.array([source_left + source_width, source_y])
+        end = numpy.array([dest_left + dest_width, dest_y])
+        control = (start + end) / 2 + [abs(dest_y - source_y) / 2 + self.font_height, 0]
+        t = numpy.linspace(0, 1, 12)[:, numpy.newaxis]
+        return (1 - t) ** 2 * start + 2 * (1 - t) * t * control + t**2 * end
+
+    def to_svg(self) -> str:
+        lines = [
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{self.width}" height="{self.height}" '
+            f'font-family="Helvetica, Arial, sans-serif" font-size="{self.font_height}">',
+            '<defs><marker id="arrow" viewBox="0 0 10 10" refX="10" refY="5" markerWidth="8" markerHeight="8" '
+            'orient="auto-start-reverse"><path d="M 0 0 L 10 5 L 0 10 z"/></marker></defs>',
+            f'<rect width="{self.width}" height="{self.height}" fill="white"/>',
+        ]
+        for source, dest in self.graph.edges:
+            points = self._edge_points(source, dest)
+            path = " ".join(f"{x:.1f},{y:.1f}" for x, y in points)
+            x, y = points[len(points) // 2]
+            lines.append(f'<polyline points="{path}" fill="none" stroke="#606060" marker-end="url(#arrow)"/>')
+            lines.append(
+                f'<text x="{x:.1f}" y="{y - 2:.1f}" text-anchor="middle" font-size="{self.font_height * 3 // 4}">'
+                f"{html.escape(self._edge_label(source, dest))}</text>"
+            )
+        for node, (left, top, width, height) in self.boxes.items():
+            fill, color, radius = ("black", "white", 6) if self._is_bottom(node) else ("lightgray", "black", 0)
+            lines.append(
+                f'<rect x="{left}" y="{top}" width="{width}" height="{height}" rx="{radius}" fill="{fill}" '
+                'stroke="black"/>'
+            )
+            lines.append(
+                f'<text x="{left + width / 2:.1f}" y="{top + height / 2:.1f}" text-anchor="middle" '
+                f'dominant-baseline="central" fill="{color}">{html.escape(self.labels[node])}</text>'
+            )
+        lines.append("</svg>")
+        return "\n".join(lines)
+
+    def to_image(self) -> numpy.ndarray:
+        """The diagram as a BGR image, (height, width, 3)."""
+        image = numpy.full((self.height, self.width, 3), 255, numpy.uint8)
+        for source, dest in self.graph.edges:
+            points = numpy.round(self._edge_points(source, dest)).astype(numpy.int32)
+            cv2.polylines(image, [points[:-1]], False, EDGE_COLOR, 1, cv2.LINE_AA)
+            length = max(float(numpy.linalg.norm(points[-1] - points[-2])), 1.0)
+            cv2.arrowedLine(
+                image, tuple(points[-2]), tuple(points[-1]), EDGE_COLOR, 1, cv2.LINE_AA, tipLength=min(8 / length, 1)
+            )
+            label = self._edge_label(source, dest)
+            x, y = points[len(points) // 2]
+            cv2.putText(
+                image,
+                label,
+                (int(x - self._text_size(label, self.label_scale)[0] / 2), int(y - 2)),
+                self.font_face,
+                self.label_scale,
+                BLACK,
+                1,
+                cv2.LINE_AA,
+            )
+        for node, (left, top, width, height) in self.boxes.items():
+            fill, color = (BLACK, WHITE) if self._is_bottom(node) else (LIGHTGRAY, BLACK)
+            cv2.rectangle(image, (left, top), (left + width, top + height), fill, cv2.FILLED)
+            cv2.rectangle(image, (left, top), (left + width, top + height), BLACK, 1)
+            text_width, text_height = self._text_size(self.labels[node], self.font_scale)
+            origin = (int(left + (width - text_width) / 2), int(top + (height + text_height) / 2))
+            cv2.putText(image, self.labels[node], origin, self.font_face, self.font_scale, color, 1, cv2.LINE_AA)
+        return image
+
+    def save(self, filename: str) -> str:
+        """Write an .svg, or any image format cv2 can write (by the suffix)."""
+        if pathlib.Path(filename).suffix.lower() == ".svg":
+            pathlib.Path(filename).write_text(self.to_svg(), encoding="utf-8")
+        elif not cv2.imwrite(str(filename), self.to_image()):
+            raise ValueError(f"Could not write {filename}")
+        return filename
+
+
+def render_many(graphs: Iterable[Tuple[networkx.DiGraph, str]], **diagram_kwargs) -> List[str]:
+    """Render (graph, filename) pairs one after the other in this process, see `SayrDiagram`."""
+    return [SayrDiagram(graph, **diagram_kwargs).save(filename) for graph, filename in graphs]
+
+
+if __name__ == "__main__":
+    from musikteori import maqamator
+    from musikteori.sayr import Sayr
+
+    parser = argparse.ArgumentParser(
+        description="Render sayrs with the built-in renderer and with graphviz dot, and compare the time it takes",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("bottoms", nargs="*", help="Names of the bottom ajnas (default: all arabic ajnas)")
+    parser.add_argument("--depth", default=1, type=int, help="Number of modulations from the bottom jins")
+    parser.add_argument("--topk", default=[1, 5], type=int, nargs="*", help="Branches to keep per depth")
+    parser.add_argument("--skip-dot", action="store_true", help="Only time the built-in renderer")
+    parser.add_argument(
+        "--output-root", default=pathlib.Path().cwd(), type=pathlib.Path, help="Parent folder to the output files"
+    )
+    args = parser.parse_args()
+
+    sayrs = {
+        bottom: Sayr(
+            maqamator.arabic_ajnas, bottom=bottom, bottom_pitch=0, bottom_degree=1, depth=args.depth, topk=args.topk
+        )
+        for bottom in args.bottoms or maqamator.arabic_ajnas
+    }
+    for sayr in sayrs.values():
+        sayr.graph
+    timings = dict()
+    start = time.perf_counter()
+    render_many((sayr.graph, str(args.output_root / f"from_{bottom}.png")) for bottom, sayr in sayrs.items())
+    timings["built-in png"] = time.perf_counter() - start
+    start = time.perf_counter()
+    render_many((sayr.graph, str(args.output_root / f"from_{bottom}.svg")) for bottom, sayr in sayrs.items())
+    timings["built-in svg"] = time.perf_counter() - start
+    if not args.skip_dot:
+        start = time.perf_counter()
+        for bottom, sayr in sayrs.items():
+            sayr.visualize(str(args.output_root / f"from_{bottom}_dot.png"))
+        timings["graphviz dot png"] = time.perf_counter() - start
+    for renderer, seconds in timings.items():
+        print(f"{renderer}: {seconds:.3f} s for {len(sayrs)} sayrs ({1000 * seconds / len(sayrs):.1f} ms per sayr)")
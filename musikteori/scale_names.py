@@ -0,0 +1,79 @@
+import contextlib
+import functools
+import hashlib
+import json
+import pathlib
+import pickle
+from typing import Dict, Optional
+
+from musikteori.cache_files import write_atomically
+
+DATA_DIRECTORY = pathlib.Path(__file__).parent
+
+
+class ScaleNames:
+    version = 1
+    sources = ("scales.json", "dozenal.json")
+
+    def __init__(self, scales: Dict[int, str], dozenal: Dict[int, str]):
+        """Names of the pitch class sets by scale id (see `pitch_class_sets.PitchClassSets`).
+
+        Attributes:
+            scales (Dict[int, str]):  The names in scales.json.
+            dozenal (Dict[int, str]): The names in dozenal.json.
+            names (Dict[int, str]):   The names in the fingering charts: the dozenal name, or the name in scales.json
+                                      where the dozenal name is not plain ascii.
+            max_word_length (int):    The length of the longest word in the names.
+        """
+        self.scales = scales
+        self.dozenal = dozenal
+        self.names = {key: value if value.isascii() else scales[key] for key, value in dozenal.items()}
+        self.max_word_length = max((len(word) for name in self.names.values() for word in name.split()), default=0)
+
+    @classmethod
+    def from_json(cls, directory: pathlib.Path = DATA_DIRECTORY) -> "ScaleNames":
+        tables = []
+        for source in cls.sources:
+            with open(directory / source, encoding="utf-8") as f:
+                tables.append({int(key): value for key, value in json.load(f).items() if key.isdigit()})
+        return cls(*tables)
+
+    @classmethod
+    def key(cls, directory: pathlib.Path = DATA_DIRECTORY) -> str:
+        digest = hashlib.sha256(f"{cls.version}".encode())
+        for source in cls.sources:
+            digest.update((directory / source).read_bytes())
+        return digest.hexdigest()
+
+    @classmethod
+    def load(cls, directory: pathlib.Path = DATA_DIRECTORY, cache: Optional[pathlib.Path] = None) -> "ScaleNames":
+        """The names, parsing the json files only if the cache is missing or was made from other content.
+
+        The cache stores the `key` it was made for, a sha256 hash of the version and the bytes of the json files, so
+        it is used only while they are unchanged, whatever their modification times.
+
+        Args:
+            directory (pathlib.Path):      Where scales.json and dozenal.json are.
+            cache (Optional[pathlib.Path]): The cache file (default: scale_names.pickle in the directory). If it
+                                           cannot be written, e.g. in a read-only install, the json is parsed each
+                                           time.
+        """
+        cache = directory / "scale_names.pickle" if cache is None else cache
+        key = cls.key(directory)
+        if cache.is_file():
+            with contextlib.suppress(
+                OSError, pickle.UnpicklingError, EOFError, AttributeError, TypeError, ValueError, KeyError
+            ):
+                with open(cache, "rb") as f:
+                    cached = pickle.load(f)
+                if cached["key"] == key and isinstance(cached["names"], cls):
+                    return cached["names"]
+        names = cls.from_json(directory)
+        write_atomically(cache, functools.partial(pickle.dump, {"key": key, "names": names}))
+        return names
+
+
+@functools.lru_cache
+def scale_names() -> ScaleNames:
+    """The names of the package data, loaded on first use."""
+    return ScaleNames.load()
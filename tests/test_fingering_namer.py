@@ -0,0 +1,90 @@
+import io
+
+import numpy
+import pytest
+from musikteori.fingering_namer import (
+    UNREACHABLE,
+    TransitionCosts,
+    format_columns_auto,
+    generate_scales,
+    get_representation,
+    get_transition_representation,
+    get_transition_representations,
+    measure_paragraphs,
+    scale_id_to_semitones,
+    semitones_to_scale_id,
+    write_columns,
+)
+
+
+class TestFingeringNamer:
+    def test_representation(self):
+        assert scale_id_to_semitones(0b101) == [0, 2]
+        assert scale_id_to_semitones(1 << 13) == [13]
+        assert get_representation((0, 2, 4, 6)) == "0--2--4--6"
+        assert get_representation([0, 14]) == "0"
+
+    def test_transition_representation(self):
+        assert get_transition_representation([0, 2, 4, 6], (0, 1, 4, 5), movement_max=2, fret_max=12) == [
+            "0--2--4--6",
+            "|--/--|--/",
+            "0-1---4-5",
+        ]
+        assert get_transition_representation([0, 2, 4, 6], (0, 1, 4, 11), movement_max=2, fret_max=12) is None
+
+    def test_batch(self):
+        for source in [[0, 2, 4, 6], [0, 1, 2], [0, 3, 5, 7, 10], [0, 10, 11]]:
+            for fingers in [3, 4, 6]:
+                for movement_max, fret_max in [(1, 12), (2, 12), (3, 9)]:
+                    targets = list(generate_scales(fingers, True)) + list(generate_scales(fingers, False))
+                    expected = []
+                    for target in targets:
+                        if representation := get_transition_representation(
+                            source, target, movement_max=movement_max, fret_max=fret_max
+                        ):
+                            expected.append((target, representation))
+                    batch = get_transition_representations(
+                        source, targets, movement_max=movement_max, fret_max=fret_max
+                    )
+                    assert list(batch) == expected
+        # one at a time for fingerings outside the table
+        assert list(get_transition_representations([0, 2], [(0, 13), (0, 2)], movement_max=2, fret_max=14)) == [
+            ((0, 13), ["0--2", "|", "0"]),
+            ((0, 2), ["0--2", "|--|", "0--2"]),
+        ]
+
+    def test_transition_costs(self, tmp_path):
+        shapes = [[0, 2, 4, 6]] + [list(scale) for scale in generate_scales(4, True)]
+        ids = [semitones_to_scale_id(shape) for shape in shapes]
+        costs = TransitionCosts.compute(ids, movement_max=2, fret_max=12, processes=2, chunk_size=100)
+        assert costs.costs.shape == (len(ids), len(ids)) and costs.costs.dtype == numpy.uint8
+        for source in shapes[:20]:
+            for target in shapes:
+                representation = get_transition_representation(source, target, movement_max=2, fret_max=12)
+                assert (costs.cost(source, target) is None) == (representation is None)
+        assert costs.cost([0, 2, 4, 6], [0, 1, 4, 5, 7]) == 2
+        assert costs.cost([0, 2, 4, 6], [0, 1, 2, 3, 4]) is None
+        cost, steps = costs.route([0, 2, 4, 6], [0, 1, 2, 3, 4])
+        assert steps[0] == [0, 2, 4, 6] and steps[-1] == [0, 1, 2, 3, 4] and len(steps) > 2
+        assert cost == sum(costs.cost(source, target) for source, target in zip(steps, steps[1:]))
+        costs.save(tmp_path / "costs.npz")
+        loaded = TransitionCosts.load(tmp_path / "costs.npz")
+        assert (loaded.costs == costs.costs).all() and loaded.route([0, 2, 4, 6], [0, 1, 2, 3, 4])[0] == cost
+        assert (costs.costs < UNREACHABLE).any()
+
+    def test_columns(self):
+        paragraphs = [["a", "bb"], ["ccc"], ["d"], ["e", "f", "g"]]
+        assert measure_paragraphs(iter(paragraphs)) == (4, 4)
+        assert measure_paragraphs([]) is None
+        f = io.StringIO()
+        pages = write_columns(iter(paragraphs), f, max_line_count=5, max_line_length=9, chunk_height=4, chunk_width=4)
+        assert pages == 2
+        # a short line keeps the columns after it in place
+        assert f.getvalue().split("\f") == [
+            "a   ccc  \nbb       \n         \n         \n         ",
+            "d   e    \n    f    \n    g    \n         \n         ",
+        ]
+        text = "\n\n".join("\n".join(paragraph) for paragraph in paragraphs)
+        assert format_columns_auto(text, 5, 9, "\n\n") == f.getvalue()
+        with pytest.raises(ValueError):
+            write_columns(paragraphs, f, max_line_count=3, max_line_length=9, chunk_height=4, chunk_width=4)
@@ -0,0 +1,55 @@
+import itertools
+
+import pytest
+from musikteori.fretboard_fingering import Fingering, Fretboard, Position
+from musikteori.jins_diagram import regular_tuning
+
+
+class TestFretboard:
+    def test_states(self):
+        assert regular_tuning(5) == [5, 0, -5, -10]
+        fretboard = Fretboard.regular(5, fret_max=12)
+        assert fretboard.string_pitches == [5, 0, -5, -10]
+        states = fretboard.states(0).tolist()
+        assert [1, 0, 0, 7] in states  # open, with the hand anywhere
+        assert [2, 5, 1, 5] in states and [2, 5, 4, 2] in states
+        assert all(fretboard.string_pitches[string] + fret == 0 for string, fret, _, _ in states)
+        assert len(fretboard.states(100)) == 0
+        assert fretboard.states(0) is fretboard.states(0)
+        with pytest.raises(ValueError):
+            Fretboard.regular(2.5)
+
+    def test_fingerings(self):
+        fretboard = Fretboard.regular(5, fret_max=12)
+        major = [0, 2, 4, 5, 7, 9, 11]
+        fingerings = fretboard.fingerings(major, octaves=1)
+        assert [fingering.cost for fingering in fingerings] == sorted(fingering.cost for fingering in fingerings)
+        assert fingerings[0].cost == 0
+        for fingering in fingerings:
+            pitches = [fretboard.string_pitches[string] + fret for string, fret, _ in fingering.positions]
+            assert [pitch - pitches[0] for pitch in pitches] == major + [12]
+        assert len({fingering.positions[0][:2] for fingering in fingerings}) == len(fingerings)
+        assert fretboard.fingerings(major, octaves=3) == []
+        assert len(fretboard.fingerings(major, top=2)) == 2
+        assert fretboard.diagram(Fingering(0, (Position(1, 0, 0), Position(1, 2, 2)))) == [
+            "-|------------",
+            "0|-2----------",
+            "-|------------",
+            "-|------------",
+        ]
+
+    def test_cheapest(self):
+        fretboard = Fretboard.regular(5, nof_strings=3, fret_max=7)
+        semitones = [0, 3, 7]
+        for fingering in fretboard.fingerings(semitones, root=-5):
+            pitches = [fretboard.string_pitches[string] + fret for string, fret, _ in fingering.positions]
+            start = fretboard.states(pitches[0])
+            start = start[(start[:, 0] == fingering.positions[0].string) & (start[:, 1] == fingering.positions[0].fret)]
+            cheapest = min(
+                sum(
+                    Fretboard.transition_costs(source[None, :], dest[None, :])[0, 0]
+                    for source, dest in zip(path, path[1:])
+                )
+                for path in itertools.product(start, *(fretboard.states(pitch) for pitch in pitches[1:]))
+            )
+            assert fingering.cost == cheapest
@@ -0,0 +1,73 @@
+import openpyxl
+from musikteori.jins_diagram import (
+    EXTENSION,
+    MODULATION,
+    OCTAVE,
+    PITCHES,
+    TONIC,
+    UNUSED,
+    ChartConfig,
+    Printer,
+    generate_charts,
+    regular_tuning,
+)
+from musikteori.maqamator import Jins, arabic_ajnas
+
+
+class TestPrinter:
+    def test_symbol_grid(self):
+        printer = Printer(arabic_ajnas, Printer.themes["stars"], regular_tuning_semitones=5, row_semitones=12)
+        grid = printer.symbol_grid(arabic_ajnas["Rast"])  # pitches 0 2 3.5 5 7, modulation 0 7, extension -1.5 -3 8 9
+        assert grid.shape == (len(regular_tuning(5)), 12 * 4 + 1)
+        string = grid[1]  # at pitch 0 on the first fret, four cells per semitone
+        expected = [TONIC, PITCHES, PITCHES, MODULATION, EXTENSION, TONIC + OCTAVE]
+        assert [string[4 * pitch] for pitch in [0, 2, 5, 7, 8, 12]] == expected
+        assert string[14] == PITCHES and string[1] == UNUSED and string[4] == UNUSED
+        assert grid[0][4 * 7] == TONIC + OCTAVE and grid[0][4 * 9] == PITCHES + OCTAVE  # pitches 12 and 14 above
+        assert grid[3][4 * 7] == EXTENSION  # pitch -3 on the lowest string
+        assert printer.symbol_grid(arabic_ajnas["Rast"]) is grid
+        assert printer.symbol_grid(Jins(pitches=[0, 2, 3.5, 5, 7], modulation_pitches=[0, 7])) is not grid
+
+    def test_str(self):
+        theme = Printer.themes["crossed"]
+        text = str(Printer({"Rast": arabic_ajnas["Rast"]}, theme))
+        lines = text.splitlines()
+        assert lines[:2] == [str(theme), "Rast"]
+        first_fret = lines[3].split("\t")[0]  # the string at pitch 0
+        assert first_fret.startswith(theme["tonic"]) and lines[3].split("\t")[12].startswith(theme["tonic"] + "⃝")
+
+    def test_to_excel(self, tmp_path):
+        theme = Printer.themes["stars"]
+        ajnas = {name: arabic_ajnas[name] for name in ["Rast", "Bayati"]}
+        Printer(ajnas, theme).to_excel(tmp_path / "ajnas.xlsx")
+        ws = openpyxl.load_workbook(tmp_path / "ajnas.xlsx").active
+        assert ws["A1"].value == str(theme)
+        assert ws["A3"].value == "Rast" and ws["A3"].font.name == "Consolas Regular"
+        assert ws["A5"].value == theme["tonic"] and not ws["A5"].font.b and ws["A5"].fill.fill_type is None
+        assert ws["AW5"].value == theme["tonic"] and ws["AW5"].font.b and ws["AW5"].fill.fgColor.rgb.endswith("DDDDDD")
+        assert ws["B5"].value is None and ws["E5"].value == theme["unused_halftone"]
+        assert ws["A9"].value == "Bayati"
+        assert ws.column_dimensions["AW"].width == ws.column_dimensions["A"].width > 0
+        assert ws.sheet_format.customHeight and ws.sheet_format.defaultRowHeight > 0
+        assert ws.print_area == "'Sheet'!$A$1:$AW$13"
+        assert len(ws.parent.named_styles) == 5  # Normal and the four fretboard styles
+
+    def test_generate_charts(self, tmp_path):
+        small = {"Rast": arabic_ajnas["Rast"], "Saba": arabic_ajnas["Saba"]}
+        configs = [
+            ChartConfig("small", theme, tuning, row_semitones)
+            for theme in ["stars", "crossed"]
+            for tuning, row_semitones in [(5, 12), (7, 24)]
+        ]
+        written = generate_charts(configs, tmp_path, processes=2, ajnas_catalogs={"small": small})
+        assert sorted(written) == sorted(tmp_path.iterdir())
+        assert len(written) == 8 and written[0].suffix == ".xlsx"
+        assert (tmp_path / "small-ajnas-crossed-tuning7-row24.txt").read_text(encoding="utf-8") == str(
+            Printer(small, Printer.themes["crossed"], regular_tuning_semitones=7, row_semitones=24)
+        )
+        assert (tmp_path / "small-ajnas-stars.xlsx").is_file()
+        assert ChartConfig("arabic", "stars").stem() == "ajnas-stars"
+        printer = Printer(small, Printer.themes["stars"])
+        assert printer.with_theme(Printer.themes["crossed"]).symbol_grid(small["Rast"]) is printer.symbol_grid(
+            small["Rast"]
+        )
@@ -0,0 +1,58 @@
+import pickle
+import pytest
+from musikteori.maqamator import Jins, JinsIndex, arabic_ajnas, letters, pitch_mask
+
+
+class TestCompiledJins:
+    def test_compile(self):
+        compiled = arabic_ajnas["SabaDalanshin"].compile()
+        assert compiled.pitches.tolist() == [-3, -1.5, 0, 1, 4, 5]
+        assert compiled.tonics.tolist() == [0, -3]
+        assert compiled.notes.tolist() == [-5, -4, -3, -1.5, 0, 1, 4, 5]
+        assert compiled.pitch_class_mask == pitch_mask([9, 0, 1, 4, 5])
+        assert compiled.quartertone_mask == pitch_mask([-3, -1.5, 0, 1, 4, 5], steps_per_octave=24)
+        with pytest.raises(AttributeError):
+            compiled.pitches = None
+        with pytest.raises(ValueError):
+            compiled.pitches[0] = 0
+
+    def test_cached_and_hashable(self):
+        jins = Jins(pitches=[0, 2, 3, 5])
+        assert jins.compile() is Jins(pitches=[0, 2, 3, 5]).compile()
+        assert {jins.compile(): "nahawand4"}[pickle.loads(pickle.dumps(jins.compile()))] == "nahawand4"
+        jins.pitches.append(7)
+        assert jins.compile().pitches.tolist() == [0, 2, 3, 5, 7]
+        assert jins.compile().to_jins().pitches == [0, 2, 3, 5, 7]
+
+    def test_no_shared_defaults(self):
+        first, second = Jins(pitches=[0, 1]), Jins(pitches=[0, 2])
+        first.extension_pitches.append(5)
+        assert second.extension_pitches == []
+
+    def test_letters(self):
+        assert letters(arabic_ajnas["Bayati"], "D") == ["B4𝄳", "C4♮", "D4♮", "E4𝄳", "F4♮", "G4♮", "A4♮", "B4♭"]
+
+
+class TestJinsIndex:
+    def test_lookups(self):
+        index = JinsIndex(arabic_ajnas)
+        assert index.by_pitches([12, 14, 15, 17, 19]) == ["Nahawand"]
+        assert ("Bayati", 2.0) in index.by_intervals([2, 3.5, 5, 7])
+        assert set(index.contained_in([0, 2, 4, 5, 7, 9, 11])) == {"Ajam5", "UpperAjam", "Ajam3"}
+        assert ("Nahawand", 9.0) in index.contained_in([0, 2, 4, 5, 7, 9, 11], transpose=True)
+        assert set(index.containing([0, 1.5])) == {"MukhalifSharqi", "Saba", "Bayati", "Sikah", "SikahBaladi"}
+
+    def test_large_catalog(self):
+        # every pitch class set, as in the ianring scale list
+        scales = {str(scale_id): [p for p in range(12) if scale_id >> p & 1] for scale_id in range(1, 4096)}
+        index = JinsIndex({name: Jins(pitches=pitches) for name, pitches in scales.items()}, steps_per_octave=12)
+        query = [0, 2, 4, 7]
+        assert sorted(index.containing(query)) == sorted(
+            name for name, pitches in scales.items() if set(query) <= set(pitches)
+        )
+        assert sorted(index.contained_in(query)) == sorted(
+            name for name, pitches in scales.items() if set(pitches) <= set(query)
+        )
+        assert sorted(index.by_intervals(query)) == sorted(
+            (str(sum(1 << ((p - shift) % 12) for p in query)), float(shift)) for shift in range(12)
+        )
@@ -1,5 +1,32 @@
 import pathlib
-from musikteori.midi_analyzer import MidiJinsAnalyzer
+import numpy
+import pretty_midi
+from musikteori.maqamator import arabic_ajnas
+from musikteori import midi_analyzer
+from musikteori.midi_analyzer import (
+    FeatureCache,
+    JinsTemplates,
+    MidiJinsAnalyzer,
+    analyze_corpus,
+    iter_midi_paths,
+    windowed_similars,
+)
+
+
+def write_midi(path: pathlib.Path, pitches, duration=0.5):
+    """Write the pitches as consecutive notes, fractional pitches become pitch bends (with a range of 2 semitones)."""
+    midi_data = pretty_midi.PrettyMIDI()
+    instrument = pretty_midi.Instrument(program=0)
+    for ix, pitch in enumerate(pitches):
+        bend = round((pitch - round(pitch)) * 8192 / 2)
+        instrument.pitch_bends.append(pretty_midi.PitchBend(pitch=bend, time=ix * duration))
+        pitch = round(pitch)
+        instrument.notes.append(
+            pretty_midi.Note(velocity=100, pitch=pitch, start=ix * duration, end=(ix + 1) * duration)
+        )
+    midi_data.instruments.append(instrument)
+    midi_data.write(str(path))
+    return path
 
 
 class TestMidiAnalyzer:
@@ -12,3 +39,110 @@ class TestMidiAnalyzer:
         analyzer = MidiJinsAnalyzer(pathlib.Path("G:/Musik/Passacaglia.mid"))
         similars = analyzer.get_top_similars()
         assert similars["Nahawand"][0] == "G"
+
+
+class TestMidiCorpus:
+    def test_corpus(self, tmp_path: pathlib.Path):
+        # G nahawand (G A Bb C D) repeated, plus a file that is not MIDI at all
+        write_midi(tmp_path / "nahawand.mid", [67, 69, 70, 72, 74] * 4)
+        (tmp_path / "corrupt.mid").write_bytes(b"not a midi file")
+        paths = list(iter_midi_paths(str(tmp_path)))
+        assert [path.name for path in paths] == ["corrupt.mid", "nahawand.mid"]
+
+        for processes in [1, 2]:
+            records = {
+                pathlib.Path(record["path"]).name: record for record in analyze_corpus(paths, processes=processes)
+            }
+            assert "error" in records["corrupt.mid"]
+            assert "Nahawand" in records["nahawand.mid"]["ties"]
+            assert records["nahawand.mid"]["tonic"] == "G"
+            assert records["nahawand.mid"]["notes"] == 20
+
+    def test_no_pitched_notes(self, tmp_path: pathlib.Path):
+        pretty_midi.PrettyMIDI().write(str(tmp_path / "empty.mid"))
+        drums = pretty_midi.PrettyMIDI()
+        drums.instruments.append(pretty_midi.Instrument(program=0, is_drum=True))
+        drums.instruments[0].notes.append(pretty_midi.Note(velocity=100, pitch=36, start=0, end=0.5))
+        drums.write(str(tmp_path / "drums.mid"))
+        paths = [tmp_path / "empty.mid", tmp_path / "drums.mid"]
+        for bins_per_octave in [12, 24]:
+            records = list(analyze_corpus(paths, processes=1, bins_per_octave=bins_per_octave))
+            assert [record["error"] for record in records] == [
+                f"ValueError: {path} has no pitched notes to match" for path in paths
+            ]
+
+    def test_cache(self, tmp_path: pathlib.Path, monkeypatch):
+        paths = [write_midi(tmp_path / f"{ix}.mid", [60 + ix, 62, 63, 65, 67] * 50) for ix in range(3)]
+        cache = FeatureCache(tmp_path / "cache")
+        listings = []
+        entries = FeatureCache._entries
+        monkeypatch.setattr(FeatureCache, "_entries", lambda self: listings.append(1) or entries(self))
+        expected = [MidiJinsAnalyzer(path, cache=cache).get_top_similars() for path in paths]
+        assert len(list(cache.directory.glob("*.npz"))) == 3
+        assert len(listings) == 1  # the size is kept as a running total
+        max_bytes = max(entry.stat().st_size for entry in cache.directory.glob("*.npz"))
+        corpus_cache = FeatureCache(tmp_path / "corpus_cache", max_bytes=max_bytes)
+        assert len(list(analyze_corpus(paths, processes=2, cache=corpus_cache))) == 3
+        assert len(list(corpus_cache.directory.glob("*.npz"))) == 1  # evicted once the workers are done
+
+        def no_parsing(*args, **kwargs):
+            raise AssertionError("parsed a cached file")
+
+        monkeypatch.setattr(midi_analyzer.pretty_midi, "PrettyMIDI", no_parsing)
+        assert [MidiJinsAnalyzer(path, cache=cache).get_top_similars() for path in paths] == expected
+        quartertones = JinsTemplates(arabic_ajnas, bins_per_octave=24)
+        assert MidiJinsAnalyzer(paths[0], quartertones, cache=cache).chroma.shape == (24,)
+
+        cache.max_bytes = max(entry.stat().st_size for entry in cache.directory.glob("*.npz"))
+        cache.evict()
+        assert len(list(cache.directory.glob("*.npz"))) == 1
+
+    def test_unwritable_cache(self, tmp_path: pathlib.Path, monkeypatch):
+        path = write_midi(tmp_path / "nahawand.mid", [67, 69, 70, 72, 74] * 4)
+        expected = MidiJinsAnalyzer(path).get_top_similars()
+        (tmp_path / "file").write_bytes(b"")
+        assert MidiJinsAnalyzer(path, cache=FeatureCache(tmp_path / "file" / "cache")).get_top_similars() == expected
+
+        def full_disk(*args, **kwargs):
+            raise OSError("No space left on device")
+
+        monkeypatch.setattr(midi_analyzer.numpy, "savez_compressed", full_disk)
+        cache = FeatureCache(tmp_path / "cache")
+        assert MidiJinsAnalyzer(path, cache=cache).get_top_similars() == expected
+        assert list(cache.directory.iterdir()) == []
+
+    def test_pitch_bends(self, tmp_path: pathlib.Path):
+        # D bayati, with E half-flat
+        path = write_midi(tmp_path / "bayati.mid", [62, 63.5, 65, 67] * 4)
+        analyzer = MidiJinsAnalyzer(path, JinsTemplates(arabic_ajnas, bins_per_octave=24))
+        assert list(numpy.flatnonzero(analyzer.chroma)) == [4, 7, 10, 14]
+        similars = analyzer.get_top_similars()
+        assert similars["Bayati"] == ("D", 1.0)
+        assert "Bayati" not in MidiJinsAnalyzer(path).get_top_similars()
+
+    def test_windows(self, tmp_path: pathlib.Path):
+        # 16 s of G nahawand followed by 16 s of D hijaz
+        path = write_midi(tmp_path / "modulation.mid", [67, 69, 70, 72, 74] * 4 + [62, 63, 66, 67] * 5, duration=0.8)
+        templates = JinsTemplates({name: arabic_ajnas[name] for name in ["Nahawand", "Hijaz"]})
+        windows = list(windowed_similars(pretty_midi.PrettyMIDI(str(path)), templates, window=4.0, hop=1.0))
+        assert [start for start, *_ in windows] == [float(start) for start in range(29)]
+        assert windows[0][1:3] == ("Nahawand", "G")
+        assert windows[-1][1:3] == ("Hijaz", "D")
+
+
+class TestJinsTemplates:
+    def test_scores(self):
+        templates = JinsTemplates(arabic_ajnas)
+        chroma = numpy.zeros(12)
+        chroma[[7, 9, 10, 0, 2]] = 0.2  # G nahawand
+        scores = templates.scores(chroma)
+        assert scores.shape == (len(arabic_ajnas), 12)
+        assert scores[templates.names.index("Nahawand"), 7] == 1.0
+        assert templates.scores(numpy.stack([chroma, chroma])).shape == (2, len(arabic_ajnas), 12)
+        assert ("Nahawand", 7, 1.0) in templates.ranking(chroma, 3)
+        assert templates.tonic_name(7) == "G"
+
+    def test_quartertones(self):
+        templates = JinsTemplates(arabic_ajnas, bins_per_octave=24)
+        assert list(numpy.flatnonzero(templates.templates[templates.names.index("Bayati")])) == [0, 3, 6, 10]
+        assert templates.tonic_name(3) == "D-50¢"
@@ -0,0 +1,20 @@
+from musikteori.pitch_class_sets import PitchClassSets, pitch_class_sets
+
+
+class TestPitchClassSets:
+    def test_table(self):
+        table = pitch_class_sets()
+        major_triad = PitchClassSets.scale_id([0, 4, 7])
+        assert major_triad == 145
+        assert table.semitones[major_triad] == (0, 4, 7)
+        assert table.representations[major_triad] == "0----4---7"
+        assert table.representations[PitchClassSets.scale_id([2, 10, 11])] == "2--------10-11"
+        assert table.modes(major_triad) == [145, PitchClassSets.scale_id([0, 3, 8]), PitchClassSets.scale_id([0, 5, 9])]
+        assert table.rotations[major_triad, 4] == PitchClassSets.scale_id([0, 3, 8])
+        assert table.inversions[major_triad] == PitchClassSets.scale_id([0, 5, 8])
+        assert table.normal_forms[PitchClassSets.scale_id([2, 6, 9])] == major_triad
+        assert table.prime_forms[major_triad] == PitchClassSets.scale_id([0, 3, 7])
+        assert len(set(table.normal_forms.tolist())) == 352
+        assert len(set(table.prime_forms.tolist())) == 224
+        assert table.name(major_triad) == "MAJian"
+        assert PitchClassSets.scale_id([0, 2.5]) is None
@@ -0,0 +1,218 @@
+import math
+
+import numpy
+import pytest
+from musikteori.maqamator import Jins, arabic_ajnas
+from musikteori.sayr import (
+    CompactGraph,
+    Location,
+    ModulationCache,
+    ModulationTable,
+    Sayr,
+    best_paths,
+    build_sayrs,
+    iraq,
+    modulation_cost,
+    similarity_score,
+    similarity_scores,
+)
+
+
+class TestSimilarity:
+    def test_similarity_score(self):
+        assert similarity_score([0, 2, 3.5, 5], [12, 14, 15.5, 17]) == 4
+        assert similarity_score([0, 2, 3.5, 5], [0, 2, 3, 5]) == 3
+        assert similarity_score([11.9], [0]) == 1  # the short way around the octave
+        assert similarity_score([0, 0], [0]) == 1  # each destination pitch pairs once
+        assert similarity_score([], [0, 1]) == 0
+
+    def test_batch(self):
+        dest = numpy.array([[0, 2, 4, numpy.nan], [0, 1, 2, 3], [numpy.nan] * 4])
+        assert similarity_scores([0, 2, 3], dest).tolist() == [2, 3, 0]
+        assert similarity_scores([0, 2, 3], dest, optimal=True).tolist() == [2, 3, 0]
+
+    def test_optimal(self):
+        # greedy pairs 0.1 with its closest pitch 0.2, which is the only one close enough to 0.3
+        assert similarity_score([0.1, 0.3], [0.2, -0.1], threshold=0.25) == 1
+        assert similarity_score([0.1, 0.3], [0.2, -0.1], threshold=0.25, optimal=True) == 2
+
+
+class TestSayr:
+    def test_modulation_cache(self):
+        modulations = ModulationCache(arabic_ajnas)
+        candidates = modulations.candidates("Rast")
+        assert "Rast" not in dict(candidates)
+        similarities = [modulation.similarity for _, modulation in candidates]
+        assert similarities == sorted(similarities, reverse=True)
+        for dest_name, modulation in candidates:
+            assert modulations.best("Rast", dest_name) == modulation
+            assert modulation.root_offset > 0
+
+    def test_modulation_table(self, tmp_path):
+        modulations = ModulationCache(arabic_ajnas)
+        table = ModulationTable.compute(arabic_ajnas, processes=2)
+        for source_name in arabic_ajnas:
+            assert table.candidates(source_name) == modulations.candidates(source_name)
+            for dest_name in arabic_ajnas:
+                assert table.best(source_name, dest_name) == modulations.best(source_name, dest_name)
+        assert (
+            ModulationTable.load(arabic_ajnas, tmp_path, processes=1).similarity.tolist() == table.similarity.tolist()
+        )
+        (entry,) = tmp_path.iterdir()
+        assert entry.name == f"modulations_{ModulationTable.key(arabic_ajnas)}.npz"
+        assert ModulationTable.load(arabic_ajnas, tmp_path).root_offset.tolist() == table.root_offset.tolist()
+        smaller = {name: jins for name, jins in arabic_ajnas.items() if name != "Rast"}
+        assert ModulationTable.key(smaller) != ModulationTable.key(arabic_ajnas)
+        (tmp_path / "file").write_bytes(b"")
+        unwritable = ModulationTable.load(smaller, tmp_path / "file" / "cache", processes=1)
+        assert unwritable.best("Bayati", "Saba") == table.best("Bayati", "Saba")
+
+        def typed(graph):  # the types too, 4.0 and 4 compare equal but label the edges differently
+            nodes = graph.nodes.data()
+            return [(node, {key: (type(value), value) for key, value in attrs.items()}) for node, attrs in nodes]
+
+        for bottom in ["Sikah", "Rast"]:
+            sayr = Sayr(arabic_ajnas, bottom=bottom, bottom_pitch=0, bottom_degree=1, depth=2, modulations=table)
+            expected = Sayr(arabic_ajnas, bottom=bottom, bottom_pitch=0, bottom_degree=1, depth=2)
+            assert list(sayr.graph.edges) == list(expected.graph.edges)
+            assert typed(sayr.graph) == typed(expected.graph)
+
+    def test_lazy_graph(self):
+        sayr = iraq()
+        assert sayr._graph is None
+        graph = sayr.graph
+        assert sayr.graph is graph
+        assert "Sikah 1 : 0/0" in graph
+        assert all(data["depth"] <= sayr.depth for _, data in graph.nodes(data=True))
+        for node, data in graph.nodes(data=True):
+            if data["depth"] < sayr.depth:
+                assert graph.out_degree(node) > 0
+
+    def test_save_load(self, tmp_path):
+        sayr = Sayr(arabic_ajnas, bottom="Kurd", bottom_pitch=0, bottom_degree=1, depth=3)
+        sayr.save(tmp_path)
+        for mmap in [False, True]:
+            loaded = Sayr.load(tmp_path, arabic_ajnas, mmap=mmap)
+            assert (loaded.bottom, loaded.depth, loaded.topk) == ("Kurd", 3, None)
+            assert list(loaded.graph.nodes(data=True)) == list(sayr.graph.nodes(data=True))
+            for (_, data), (_, expected) in zip(loaded.graph.nodes(data=True), sayr.graph.nodes(data=True)):
+                # the types too, 4.0 and 4 compare equal but label the edges differently
+                assert {key: (type(value), str(value)) for key, value in data.items() if key != "jins"} == {
+                    key: (type(value), str(value)) for key, value in expected.items() if key != "jins"
+                }
+            assert list(loaded.graph.edges) == list(sayr.graph.edges)
+        compact = CompactGraph.load(tmp_path, mmap=True)
+        assert len(compact) == len(sayr.graph)
+        assert compact.identity(0) == "Kurd 1 : 0/0"
+        assert [compact.identity(dest) for dest in compact.successors(0)] == list(sayr.graph.successors("Kurd 1 : 0/0"))
+
+    def test_incremental(self):
+        def snapshot(graph):
+            nodes = {node: {**data, "jins": data["jins"].pitches} for node, data in graph.nodes(data=True)}
+            return nodes, set(graph.edges)
+
+        changes = [
+            ("add_jins", "Test", Jins(pitches=[0, 1.5, 3.5, 5], modulation_pitches=[0, 5], tonics=[0])),
+            ("update_jins", "Bayati", Jins(pitches=[0, 2, 3.5, 5], modulation_pitches=[0, 3.5, 5], tonics=[0])),
+            ("remove_jins", "Nahawand"),
+            ("update_jins", "Rast", Jins(pitches=[0, 2, 3.5, 5, 7], modulation_pitches=[0, 5, 7], tonics=[0])),
+        ]
+        for modulations in [ModulationCache(arabic_ajnas), ModulationTable.compute(arabic_ajnas, processes=1)]:
+            for depth, topk in [(3, None), (3, [1, 5, 3, 2])]:
+                sayr = Sayr(arabic_ajnas, "Rast", 0, 1, depth, topk, modulations=modulations)
+                sayr.graph
+                for method, *args in changes:
+                    getattr(sayr, method)(*args)
+                    expected = Sayr(sayr.ajnas, "Rast", 0, 1, depth, topk)
+                    assert snapshot(sayr.graph) == snapshot(expected.graph)
+        # Sazkar leaves the graph while SabaZamzam changes, and comes back with its old expansions
+        returning = Sayr(arabic_ajnas, "Sazkar", 0, 1, 2, [1, 1, 1])
+        returning.graph
+        returning.update_jins("Sazkar", arabic_ajnas["Hijaz"])
+        returning.update_jins("SabaZamzam", Jins(pitches=[0, 2, 5, 7], modulation_pitches=[0, 7]))
+        returning.update_jins("Sazkar", arabic_ajnas["Sazkar"])
+        assert snapshot(returning.graph) == snapshot(Sayr(returning.ajnas, "Sazkar", 0, 1, 2, [1, 1, 1]).graph)
+        assert "Test" not in arabic_ajnas and "Nahawand" in arabic_ajnas
+        with pytest.raises(ValueError):
+            sayr.remove_jins("Rast")
+        with pytest.raises(KeyError):
+            sayr.update_jins("Nahawand", arabic_ajnas["Nahawand"])
+
+    def test_build_sayrs(self):
+        bottoms = ["Rast", "Hijaz", "Bayati"]
+        built = dict(build_sayrs(arabic_ajnas, bottoms, processes=2, depth=1, topk=[1, 5]))
+        assert sorted(built) == sorted(bottoms)
+        for bottom, sayr in built.items():
+            expected = Sayr(arabic_ajnas, bottom=bottom, bottom_pitch=0, bottom_degree=1, depth=1, topk=[1, 5])
+            assert sayr._graph is not None
+            assert set(sayr.graph.edges) == set(expected.graph.edges)
+
+
+class TestBestPaths:
+    @staticmethod
+    def all_costs(modulations, location, target, target_tonic_pitch, depth):
+        if location.name == target and (target_tonic_pitch is None or location.tonic_pitch == target_tonic_pitch):
+            return [0.0]
+        if depth == 0:
+            return []
+        costs = []
+        for dest_name, modulation in modulations.candidates(location.name):
+            dest = Location(
+                dest_name,
+                location.root_pitch + modulation.root_offset,
+                location.root_pitch + modulation.tonic_offset,
+                location.degree + modulation.modulation_index,
+            )
+            for cost in TestBestPaths.all_costs(modulations, dest, target, target_tonic_pitch, depth - 1):
+                costs.append(modulation_cost(modulation.similarity) + cost)
+        return costs
+
+    def test_cheapest_first(self):
+        modulations = ModulationCache(arabic_ajnas)
+        for source, target, target_tonic_pitch in [
+            ("Rast", "Saba", None),
+            ("Sikah", "Nahawand", 7),
+            ("Rast", "Rast", 7),
+        ]:
+            start = Location(source, min(arabic_ajnas[source].pitches), 0, 1)
+            expected = sorted(self.all_costs(modulations, start, target, target_tonic_pitch, 3))[:5]
+            paths = best_paths(modulations, source, target, 5, target_tonic_pitch=target_tonic_pitch, max_depth=3)
+            assert len(paths) == len(expected)
+            assert all(math.isclose(path.cost, cost) for path, cost in zip(paths, expected))
+
+    def test_paths(self):
+        sayr = Sayr(arabic_ajnas, bottom="Rast", bottom_pitch=0, bottom_degree=1, depth=2)
+        (path,) = sayr.best_paths("Saba")
+        assert [location.name for location in path.locations] == ["Rast", "Saba"]
+        assert path.locations[-1] == Location("Saba", 4, 4, 5)
+        assert path.cost == modulation_cost(path.similarities[0])
+        assert sayr._graph is None
+        for path in sayr.best_paths("Nahawand", 3, target_tonic_pitch=7):
+            assert path.locations[-1].tonic_pitch == 7
+            assert len(path.locations) <= 3
+        assert sayr.best_paths("Nahawand", target_tonic_pitch=-12) == []
+
+    def test_bounds(self):
+        modulations = ModulationCache(arabic_ajnas)
+        table = ModulationTable.compute(arabic_ajnas, processes=1)
+        bounds = modulations.bounds()
+        assert modulations.bounds() is bounds and table.bounds() is table.bounds()
+        assert table.bounds().predecessors == bounds.predecessors
+        assert (table.bounds().max_similarity, table.bounds().max_root_offset) == (
+            bounds.max_similarity,
+            bounds.max_root_offset,
+        )
+        hops = bounds.hops("Saba")
+        assert bounds.hops("Saba") is hops and hops["Saba"] == 0 and hops["Rast"] == 1
+        assert table.bounds().hops("Saba") == hops
+        assert [path.cost for path in best_paths(modulations, "Sikah", "Nahawand", 3)] == [
+            path.cost for path in best_paths(table, "Sikah", "Nahawand", 3)
+        ]
+
+    def test_single_jins(self):
+        rast = {"Rast": arabic_ajnas["Rast"]}
+        for modulations in [ModulationCache(rast), ModulationTable.compute(rast, processes=1)]:
+            (path,) = best_paths(modulations, "Rast", "Rast")
+            assert path == (0.0, (Location("Rast", 0, 0, 1),), ())
+            assert best_paths(modulations, "Rast", "Rast", target_tonic_pitch=0) == [path]
+            assert best_paths(modulations, "Rast", "Rast", target_tonic_pitch=7) == []
@@ -0,0 +1,28 @@
+import networkx
+from musikteori.maqamator import arabic_ajnas
+from musikteori.sayr import Sayr
+from musikteori.sayr_diagram import SayrDiagram, layered_layout, render_many
+
+
+class TestSayrDiagram:
+    def test_layered_layout(self):
+        graph = networkx.DiGraph()
+        for node, tonic_pitch in [("a", 0), ("b", 2), ("c", 2), ("d", 4), ("e", 4)]:
+            graph.add_node(node, tonic_pitch=tonic_pitch)
+        graph.add_edges_from([("a", "c"), ("a", "b"), ("c", "e"), ("b", "d")])
+        placement = layered_layout(graph)
+        assert [placement[node][0] for node in "abcde"] == [0, 1, 1, 2, 2]
+        # d and e follow the order of b and c, so the edges do not cross
+        assert (placement["b"][1] < placement["c"][1]) == (placement["d"][1] < placement["e"][1])
+
+    def test_render(self, tmp_path):
+        sayr = Sayr(arabic_ajnas, bottom="Rast", bottom_pitch=0, bottom_degree=1, depth=2, topk=[1, 5, 3])
+        diagram = SayrDiagram(sayr.graph)
+        assert diagram.to_image().shape == (diagram.height, diagram.width, 3)
+        svg = diagram.to_svg()
+        assert svg.count("<rect") == len(sayr.graph) + 1
+        assert svg.count("<polyline") == sayr.graph.number_of_edges()
+        filenames = [str(tmp_path / "rast.png"), str(tmp_path / "rast.svg")]
+        assert render_many([(sayr.graph, filename) for filename in filenames]) == filenames
+        assert all((tmp_path / name).stat().st_size > 0 for name in ["rast.png", "rast.svg"])
+        assert sayr.visualize(str(tmp_path / "builtin.png"), engine="builtin") == str(tmp_path / "builtin.png")
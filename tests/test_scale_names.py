@@ -0,0 +1,32 @@
+import json
+import shutil
+
+from musikteori.pitch_class_sets import load_scale_names
+from musikteori.scale_names import DATA_DIRECTORY, ScaleNames, scale_names
+
+
+class TestScaleNames:
+    def test_names(self):
+        names = scale_names()
+        assert scale_names() is names
+        assert names.names[0b10010001] == "MAJian" and names.names[0b101010110101] == "IONian"
+        assert load_scale_names() is names.names
+        assert names.max_word_length == max(len(word) for name in names.names.values() for word in name.split())
+
+    def test_cache(self, tmp_path):
+        for source in ScaleNames.sources:
+            shutil.copy(DATA_DIRECTORY / source, tmp_path)
+        parsed = ScaleNames.load(tmp_path)
+        assert (tmp_path / "scale_names.pickle").is_file()
+        cached = ScaleNames.load(tmp_path)
+        assert cached.names == parsed.names and cached.scales == parsed.scales
+        # a changed name table is parsed again
+        dozenal = json.loads((tmp_path / "dozenal.json").read_text(encoding="utf-8"))
+        dozenal["145"] = "changed"
+        (tmp_path / "dozenal.json").write_text(json.dumps(dozenal), encoding="utf-8")
+        assert ScaleNames.load(tmp_path).names[145] == "changed"
+        assert ScaleNames.load(tmp_path).names[145] == "changed"
+        # a cache that cannot be written or read is skipped
+        assert ScaleNames.load(tmp_path, tmp_path / "missing" / "names.pickle").names[145] == "changed"
+        (tmp_path / "scale_names.pickle").write_bytes(b"garbage")
+        assert ScaleNames.load(tmp_path).names == ScaleNames.from_json(tmp_path).names